@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Benchmark pyness3 on a synthetic scan.
+
+Writes a NessusClientData_v2 file of the requested shape, runs each stage
+of pyness3's main() on it separately and appends the timings, throughput,
+per stage memory and the process peak RSS to a JSON lines file, one
+record per run, so runs of different versions on the same box can be
+compared.
+
+    python bench_pyness3.py --hosts 500 --findings 80 --output-size 2048
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from xml.sax.saxutils import escape, quoteattr
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, peak RSS is left out there
+    resource = None
+
+import pyness3
+
+# severity attribute, risk_factor and cvss3 score written for each rating
+SEVERITY_ATTRS = {
+    "Critical": (4, "Critical", "9.8"),
+    "High": (3, "High", "7.5"),
+    "Medium": (2, "Medium", "5.3"),
+    "Low": (1, "Low", "3.1"),
+    "Info": (0, "None", None),
+}
+DEFAULT_MIX = "Critical=3,High=7,Medium=15,Low=10,Info=65"
+
+# Just the placeholders pyness3 fills in, used when files/ isn't next to
+# pyness3.py
+SYNTHETIC_TEMPLATES = {
+    "vbh_template.html": "<html><body><h1>|||HOSTNAME_IP|||</h1><p>|||COMPANYNAME|||</p>"
+                         "<p>|||TOTALFINDINGS||| |||TOTALCRITICAL||| |||TOTALHIGH||| |||TOTALMEDIUM||| "
+                         "|||TOTALLOW||| |||TOTALINFORMATION|||</p>|||PIE-CHART|||<div>|||REPLACEME||||</div>"
+                         "</body></html>\n",
+    "allvulns_template.html": "<html><body><p>|||TOTALFINDINGS||| |||TOTALCRITICAL||| |||TOTALHIGH||| "
+                              "|||TOTALMEDIUM||| |||TOTALLOW||| |||TOTALINFORMATION|||</p>|||PIE-CHART|||"
+                              "<div>|||REPLACEME||||</div></body></html>\n",
+    "index.html": "<html><body><p>|||COMPANYNAME||| |||TIMECREATED|||</p><p>|||TOTALFINDINGS||| "
+                  "|||TOTALCRITICAL||| |||TOTALHIGH||| |||TOTALMEDIUM||| |||TOTALLOW||| "
+                  "|||TOTALINFORMATION|||</p>|||PIE-CHART|||<table>|||TABLEREPLACE|||</table></body></html>\n",
+}
+
+
+def parse_mix(text):
+    # "Critical=3,High=7,..." -> {"Critical": 3.0, ...}
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip().capitalize()
+        if name not in SEVERITY_ATTRS:
+            raise argparse.ArgumentTypeError(f"unknown severity {name!r} in --severity-mix")
+        mix[name] = float(weight)
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("--severity-mix needs at least one non-zero weight")
+    return mix
+
+
+def write_synthetic_scan(path, hosts, findings, mix, output_size, plugins, seed):
+    """
+    Every plugin gets one severity (drawn from mix) and fixed text, like a
+    real scan where the same plugin fires on many hosts. Each host gets
+    findings distinct plugins, plugin_output is output_size characters.
+    """
+    rng = random.Random(seed)
+    names = list(mix)
+    pluginSeverity = rng.choices(names, weights=[mix[n] for n in names], k=plugins)
+    byRating = {name: [p for p in range(plugins) if pluginSeverity[p] == name] for name in names}
+    weights = [mix[n] if byRating[n] else 0 for n in names]
+    filler = "".join(rng.choices("abcdefghijklmnopqrstuvwxyz0123456789 \n<>&", k=max(output_size, 1)))
+    started = datetime(2022, 11, 21, 10, 0, 0)
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" ?>\n<NessusClientData_v2>\n<Report name="bench">\n')
+        for h in range(hosts):
+            ip = f"10.{(h >> 16) & 255}.{(h >> 8) & 255}.{h & 255}"
+            name = f"host{h}.bench.example"
+            f.write(f"<ReportHost name={quoteattr(name)}><HostProperties>\n")
+            tags = {
+                "HOST_END": (started + timedelta(minutes=10)).strftime(pyness3.HOST_TIME_FORMAT),
+                "host-ip": ip,
+                "host-fqdn": name,
+                "netbios-name": f"HOST{h}",
+                "operating-system": "Linux Kernel 5.15",
+                "mac-address": f"00:16:3e:{(h >> 16) & 255:02x}:{(h >> 8) & 255:02x}:{h & 255:02x}",
+                "HOST_START": started.strftime(pyness3.HOST_TIME_FORMAT),
+            }
+            for tag, value in tags.items():
+                f.write(f"<tag name={quoteattr(tag)}>{escape(value)}</tag>\n")
+            f.write("</HostProperties>\n")
+
+            chosen = set()
+            target = min(findings, plugins)
+            # redraw repeats, giving up eventually if the mix is very lopsided
+            for _ in range(target * 20):
+                if len(chosen) == target:
+                    break
+                rating = rng.choices(names, weights=weights)[0]
+                plugin = rng.choice(byRating[rating])
+                if plugin in chosen:
+                    continue
+                chosen.add(plugin)
+                severity, riskFactor, cvss3 = SEVERITY_ATTRS[rating]
+                pluginId = 100000 + plugin
+                port = (22, 80, 443, 445, 3389, 8080)[plugin % 6]
+                f.write(f'<ReportItem port="{port}" svc_name="svc{port}" protocol="tcp" '
+                        f'severity="{severity}" pluginID="{pluginId}" pluginName="Bench plugin {pluginId}" '
+                        f'pluginFamily="Family {plugin % 12}">\n')
+                f.write(f"<plugin_name>Bench plugin {pluginId} &lt;{rating}&gt;</plugin_name>\n")
+                f.write(f"<risk_factor>{riskFactor}</risk_factor>\n")
+                f.write(f"<synopsis>Synopsis of plugin {pluginId}.</synopsis>\n")
+                f.write(f"<description>{escape(filler[:200])}\nplugin {pluginId}</description>\n")
+                f.write(f"<solution>Upgrade component {plugin % 40}.</solution>\n")
+                if cvss3:
+                    f.write(f"<cvss3_base_score>{cvss3}</cvss3_base_score>\n")
+                    f.write(f"<cve>CVE-2022-{10000 + plugin}</cve>\n")
+                offset = (h * 31 + plugin) % max(output_size, 1)
+                f.write(f"<plugin_output>{escape((filler[offset:] + filler[:offset])[:output_size])}</plugin_output>\n")
+                f.write("</ReportItem>\n")
+            f.write("</ReportHost>\n")
+        f.write("</Report>\n</NessusClientData_v2>\n")
+
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes everywhere else
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(pyness3.__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def template_paths(workDir):
+    # the real templates when they are there, otherwise the synthetic ones
+    filesDir = os.path.join(os.path.dirname(os.path.abspath(pyness3.__file__)), "files")
+    real = (os.path.join(filesDir, "template", "vbh_template.html"),
+            os.path.join(filesDir, "template", "allvulns_template.html"),
+            os.path.join(filesDir, "index.html"))
+    if all(os.path.exists(p) for p in real):
+        return real
+    for name, text in SYNTHETIC_TEMPLATES.items():
+        with open(os.path.join(workDir, name), "w") as f:
+            f.write(text)
+    return tuple(os.path.join(workDir, name) for name in SYNTHETIC_TEMPLATES)
+
+
+def run_stages(nessusFile, workDir, options, trace_memory=True):
+    """
+    The stages of pyness3.main() one at a time. The hosts are read into a
+    list first so the xml parse and parse_reports can be timed apart;
+    main() streams one into the other.
+
+    With trace_memory each stage records, from tracemalloc, the most memory
+    it had allocated at once on top of what was live when it started, and
+    how much of that it left behind. This only sees this process, not
+    --jobs workers, and tracing slows every stage down, so only compare
+    timings of runs made the same way.
+    """
+    vbhTemplate, allvulnsTemplate, indexTemplate = template_paths(workDir)
+    reportDir = os.path.join(workDir, "report")
+    os.makedirs(os.path.join(reportDir, "allvulns"), exist_ok=True)
+    if options['lazy_bodies']:
+        pyness3.write_lazy_loader(os.path.join(reportDir, "assets"))
+
+    stages = {}
+    state = {}
+
+    def stage(name, func):
+        if trace_memory:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            state[name] = func()
+        stages[name] = {"seconds": round(time.perf_counter() - started, 4)}
+        if trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            stages[name]["alloc_peak_kb"] = (peak - before) // 1024
+            stages[name]["alloc_retained_kb"] = (current - before) // 1024
+
+    stage("parse", lambda: list(pyness3.iter_report_hosts(nessusFile)))
+    stage("parse_reports", lambda: pyness3.parse_reports(state["parse"]))
+    reports = state["parse_reports"]
+    del state["parse"]
+
+    # cold pie chart cache, one chart per host plus the two summary charts
+    pyness3._draw_pieChart_cached.cache_clear()
+    counts = [{"critical": r._critical_count, "high": r._high_count, "medium": r._medium_count,
+               "low": r._low_count, "info": r._info_count} for r in reports.hosts]
+    stage("charts", lambda: [pyness3.draw_pieChart(c, options['chart_backend']) for c in counts])
+    pyness3._draw_pieChart_cached.cache_clear()
+
+    stage("create_vulnbyHost", lambda: pyness3.create_vulnbyHost(
+        reports, vbhTemplate, reportDir, options))
+    stage("build_dashboard_page", lambda: pyness3.build_dashboard_page(
+        reports, indexTemplate, os.path.join(reportDir, "index.html"),
+        pyness3.getall_findingTotals(reports), options))
+    stage("build_allvulns_page", lambda: pyness3.build_allvulns_page(
+        reports, allvulnsTemplate, os.path.join(reportDir, "allvulns", "allvulns_template.html"), options))
+    stage("build_search_index", lambda: pyness3.build_search_index(
+        reports, os.path.join(reportDir, "assets")))
+
+    findingCount = sum(len(r._vulns) for r in reports.hosts)
+    for name, result in stages.items():
+        result["findings_per_second"] = round(findingCount / result["seconds"]) if result["seconds"] else None
+    return reports.host_count(), findingCount, stages
+
+
+def main():
+    par = argparse.ArgumentParser(description="Time each stage of pyness3 on a synthetic .nessus file")
+    par.add_argument("--hosts", type=int, default=200, help="Number of ReportHosts (default: %(default)s)")
+    par.add_argument("--findings", type=int, default=60,
+                     help="ReportItems per host, at most --plugins (default: %(default)s)")
+    par.add_argument("--severity-mix", type=parse_mix, default=DEFAULT_MIX, metavar="MIX",
+                     help="Relative weight of each severity (default: %(default)s)")
+    par.add_argument("--output-size", type=int, default=1024,
+                     help="Characters of plugin_output per finding (default: %(default)s)")
+    par.add_argument("--plugins", type=int, default=400,
+                     help="Distinct plugins the findings are drawn from (default: %(default)s)")
+    par.add_argument("--seed", type=int, default=1, help="Random seed for the synthetic scan (default: %(default)s)")
+    par.add_argument("-i", "--input-file", default=None,
+                     help="Benchmark this .nessus file instead of generating one")
+    par.add_argument("-j", "--jobs", type=int, default=1, help="Passed on as pyness3 --jobs (default: %(default)s)")
+    par.add_argument("--chart-backend", choices=("cairo", "native"), default=pyness3.DEFAULT_CHART_BACKEND,
+                     help="Passed on as pyness3 --chart-backend (default: %(default)s)")
+    par.add_argument("-g", "--group-by-plugin", action="store_true", help="Passed on as pyness3 --group-by-plugin")
+    par.add_argument("--page-size", type=int, default=0, help="Passed on as pyness3 --page-size")
+    par.add_argument("--lazy-bodies", action="store_true", help="Passed on as pyness3 --lazy-bodies")
+    par.add_argument("-o", "--results", default="bench_results.jsonl",
+                     help="JSON lines file the run is appended to (default: %(default)s)")
+    par.add_argument("--keep", action="store_true", help="Keep the generated scan and report folder")
+    par.add_argument("--no-trace-memory", action="store_true",
+                     help="Don't measure per stage memory with tracemalloc, which slows the stages down")
+    args = par.parse_args()
+    if args.chart_backend == "cairo" and not pyness3.CAIRO_AVAILABLE:
+        par.error("pycairo is not installed, use --chart-backend native")
+    if isinstance(args.severity_mix, str):
+        args.severity_mix = parse_mix(args.severity_mix)
+
+    workDir = tempfile.mkdtemp(prefix="pyness3-bench-")
+    try:
+        nessusFile = args.input_file
+        generated = None
+        if nessusFile is None:
+            nessusFile = os.path.join(workDir, "bench.nessus")
+            started = time.perf_counter()
+            write_synthetic_scan(nessusFile, args.hosts, args.findings, args.severity_mix,
+                                 args.output_size, args.plugins, args.seed)
+            generated = round(time.perf_counter() - started, 4)
+
+        options = {
+            "input_file": [nessusFile],
+            "customerName": "Bench",
+            "jobs": args.jobs,
+            "chart_backend": args.chart_backend,
+            "group_by_plugin": args.group_by_plugin,
+            "page_size": args.page_size,
+            "lazy_bodies": args.lazy_bodies,
+        }
+        traceMemory = not args.no_trace_memory
+        if traceMemory:
+            tracemalloc.start()
+        try:
+            hostCount, findingCount, stages = run_stages(nessusFile, workDir, options, traceMemory)
+        finally:
+            if traceMemory:
+                tracemalloc.stop()
+        fileSize = os.path.getsize(nessusFile)
+        parseSeconds = stages["parse"]["seconds"]
+        stages["parse"]["mb_per_second"] = round(fileSize / 1e6 / parseSeconds, 2) if parseSeconds else None
+
+        record = {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "parameters": {
+                "input_file": args.input_file,
+                "hosts": args.hosts, "findings": args.findings,
+                "severity_mix": args.severity_mix, "output_size": args.output_size,
+                "plugins": args.plugins, "seed": args.seed,
+                **{k: v for k, v in options.items() if k not in ("input_file", "customerName")},
+                "trace_memory": traceMemory,
+            },
+            "generate_seconds": generated,
+            "file_bytes": fileSize,
+            "report_hosts": hostCount,
+            "report_findings": findingCount,
+            "stages": stages,
+            "total_seconds": round(sum(s["seconds"] for s in stages.values()), 4),
+            # high-water mark of the whole process, generating the scan included
+            "process_peak_rss_kb": peak_rss_kb(),
+        }
+        with open(args.results, "a") as f:
+            f.write(json.dumps(record) + "\n")
+    finally:
+        if args.keep:
+            print(f"Kept {workDir}")
+        else:
+            shutil.rmtree(workDir, ignore_errors=True)
+
+    print(f"{hostCount} hosts, {findingCount} findings, {fileSize / 1e6:.1f} MB")
+    for name, result in stages.items():
+        memory = f"  {result['alloc_peak_kb'] / 1024:>8.1f} MB peak" if "alloc_peak_kb" in result else ""
+        print(f"  {name:<22} {result['seconds']:>9.3f}s  {result['findings_per_second'] or 0:>10} findings/s{memory}")
+    if record["process_peak_rss_kb"] is not None:
+        print(f"Process peak RSS: {record['process_peak_rss_kb'] / 1024:.1f} MB")
+    print(f"Results appended to {args.results}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 
 import cairo
-from math import pi
+import functools
+import io
+from math import pi, gcd
 
 # RGB values
 # crit: 229,71,97
@@ -79,32 +81,25 @@ def path_ellipse(cr, x, y, width, height, angle=0):
     cr.restore()
 
 
+# Order the pie segments are drawn in
+PIE_CHART_ORDER = ("critical", "high", "medium", "low", "info")
+
+
 def draw_pieChart(stats):
-    # stats will be str:int
-    totalVuln = 0
-    for s in stats:
-        totalVuln += int(stats[s])
+    # stats will be str:int, identical severity ratios share one drawing
+    counts = tuple(int(stats[name]) for name in PIE_CHART_ORDER)
+    divisor = functools.reduce(gcd, counts) or 1
+    return _draw_pieChart_cached(tuple(c // divisor for c in counts))
+
+
+@functools.lru_cache(maxsize=4096)
+def _draw_pieChart_cached(counts):
+    totalVuln = sum(counts)
     # Get percent of all values
+    percents = [getPercent(c, totalVuln) if totalVuln else 0 for c in counts]
 
-    CriticialPercent = getPercent(int(stats["critical"]), totalVuln)
-    HighPercent = getPercent(int(stats["high"]), totalVuln)
-    MediumPercent = getPercent(int(stats["medium"]), totalVuln)
-    LowPercent = getPercent(int(stats["low"]), totalVuln)
-    InfoPercent = getPercent(int(stats["info"]), totalVuln)
-
-    t = CriticialPercent + HighPercent + MediumPercent + LowPercent + InfoPercent
-    # print()
-    # print(f"crit: {CriticialPercent}, high: {HighPercent}, med: {MediumPercent}, low: {LowPercent}, info: {InfoPercent}")
-    # print(f"Total: {t}")
-    # print()
-
-    stats['critical'] = CriticialPercent
-    stats['high'] = HighPercent
-    stats['medium'] = MediumPercent
-    stats['low'] = LowPercent
-    stats['info'] = InfoPercent
-
-    with cairo.SVGSurface("test.svg", 200, 200) as surface:
+    svgBuffer = io.BytesIO()
+    with cairo.SVGSurface(svgBuffer, 200, 200) as surface:
         context = cairo.Context(surface)
 
         context.scale(200, 200)
@@ -119,16 +114,13 @@ def draw_pieChart(stats):
         context.fill()
 
         lastPoint = 0
-        for stat in stats:
-            statPoint = stats[stat]
+        for stat, statPoint in zip(PIE_CHART_ORDER, percents):
             start = lastPoint
             end = statPoint+start
 
             draw_segment(context, start, end, stat)
             lastPoint += statPoint
-    with open("test.svg", "r") as content:
-        svgContent = content.read()
-    return svgContent
+    return svgBuffer.getvalue().decode()
 
 #inputVars = {"critical":"1","high":"1","medium":"1","low":"1", "info":"1"}
 #inputVars = {"critical":"0","high":"0","medium":"0","low":"0", "info":"4"}
@@ -140,4 +132,4 @@ inputVars = {"critical": "6", "high": "2",
 imageText = draw_pieChart(inputVars)
 
 print(imageText)
-print("File Saved")
+print(_draw_pieChart_cached.cache_info())
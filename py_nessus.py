@@ -2,6 +2,8 @@
 import json
 import xmltodict
 
+from pyness3 import count_severities
+
 NESSUSFILE = r"C:\Users\ac1d\Desktop\NessusPython\jtc_xbzgqj.nessus"
 # Convert Xml to JSON
 with open(NESSUSFILE) as xml_file:
@@ -34,22 +36,10 @@ class Report(object):
             self.vulns = vulns
 
             # update totals
-            for r in self.vulns:
-                for v in r:
-                    if v == "risk_factor":
-                        rating = r[v]
-                        if rating == "Info":
-                            self.infoCount += 1
-                        if rating == "Low":
-                            self.lowCount += 1
-                        if rating == "Medium":
-                            self.mediumCount += 1
-                        if rating == "High":
-                            self.highCount += 1
-                        if rating == "Critical":
-                            self.criticalCount += 1
-                        self.totalCount = self.criticalCount + self.highCount + \
-                            self.mediumCount + self.lowCount + self.infoCount
+            counts = count_severities(r['risk_factor'] for r in self.vulns)
+            (self.criticalCount, self.highCount, self.mediumCount,
+             self.lowCount, self.infoCount) = counts
+            self.totalCount = sum(counts)
 
         def print_vuln_stats(self):
             return print(f"Critical: {self.criticalCount}\nHigh: {self.highCount}\nMedium: {self.mediumCount}\nLow: {self.lowCount}\nInfo: {self.infoCount}\nTotal: {self.totalCount}")
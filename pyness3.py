@@ -1,19 +1,35 @@
 #!/usr/bin/env python3
 
 import argparse
+import functools
+import glob
+import hashlib
+import importlib.util
 import itertools
 import json
-import xmltodict
-import cairo
-from math import pi
+import pickle
+import xml.etree.ElementTree as ET
+from array import array
+from math import pi, gcd, cos, sin
+import io
 import os
+import sys
 import shutil
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 import time
 
 import unicodedata
 import re
 
+import numpy as np
+
+# pycairo is only needed for --chart-backend cairo, and is only imported
+# (by draw_pieChart_cairo) once a chart is actually drawn with it
+CAIRO_AVAILABLE = importlib.util.find_spec("cairo") is not None
+
+DEFAULT_CHART_BACKEND = "cairo" if CAIRO_AVAILABLE else "native"
+
 
 def datetime_from_utc_to_local(utc_datetime):
     now_timestamp = time.time()
@@ -108,32 +124,80 @@ def path_ellipse(cr, x, y, width, height, angle=0):
     cr.restore()
 
 
-def draw_pieChart(stats):
-    # stats will be str:int
-    totalVuln = 0
-    for s in stats:
-        totalVuln += int(stats[s])
-    # Get percent of all values
-
-    CriticialPercent = getPercent(int(stats["critical"]), totalVuln)
-    HighPercent = getPercent(int(stats["high"]), totalVuln)
-    MediumPercent = getPercent(int(stats["medium"]), totalVuln)
-    LowPercent = getPercent(int(stats["low"]), totalVuln)
-    InfoPercent = getPercent(int(stats["info"]), totalVuln)
-
-    t = CriticialPercent + HighPercent + MediumPercent + LowPercent + InfoPercent
-    # print()
-    # print(f"crit: {CriticialPercent}, high: {HighPercent}, med: {MediumPercent}, low: {LowPercent}, info: {InfoPercent}")
-    # print(f"Total: {t}")
-    # print()
-
-    stats['critical'] = CriticialPercent
-    stats['high'] = HighPercent
-    stats['medium'] = MediumPercent
-    stats['low'] = LowPercent
-    stats['info'] = InfoPercent
-
-    with cairo.SVGSurface("test.svg", 200, 200) as surface:
+# Order the pie segments are drawn in
+PIE_CHART_ORDER = ("critical", "high", "medium", "low", "info")
+
+
+def draw_pieChart(stats, backend=DEFAULT_CHART_BACKEND):
+    # stats will be str:int. Many hosts share the same severity mix, so the
+    # counts are reduced to their smallest ratio (2/4/2 draws like 1/2/1)
+    # and the svg for each distinct ratio is drawn only once.
+    counts = tuple(int(stats[name]) for name in PIE_CHART_ORDER)
+    divisor = functools.reduce(gcd, counts) or 1
+    return _draw_pieChart_cached(tuple(c // divisor for c in counts), backend)
+
+
+@functools.lru_cache(maxsize=4096)
+def _draw_pieChart_cached(counts, backend):
+    if backend == "native":
+        return draw_pieChart_native(counts)
+    return draw_pieChart_cairo(counts)
+
+
+def svgColorforvuln(name):
+    r, g, b, a = getColorforvuln(name)
+    return f"rgb({round(r * 255)},{round(g * 255)},{round(b * 255)})"
+
+
+# Same geometry as the cairo chart on its 200x200 surface: a black base
+# circle (r=99) with the severity segments (r=98) drawn clockwise from 3 o'clock.
+PIE_CENTER = 100
+PIE_BASE_RADIUS = 99
+PIE_RADIUS = 98
+PIE_FILLS = {name: svgColorforvuln(name) for name in PIE_CHART_ORDER}
+
+
+def draw_pieChart_native(counts):
+    totalVuln = sum(counts)
+    parts = [
+        '<svg xmlns="http://www.w3.org/2000/svg" width="200pt" height="200pt" viewBox="0 0 200 200">',
+        f'<circle cx="{PIE_CENTER}" cy="{PIE_CENTER}" r="{PIE_BASE_RADIUS}" fill="rgb(0,0,0)"/>',
+    ]
+    angle = 0.0
+    x1, y1 = PIE_CENTER + PIE_RADIUS, PIE_CENTER
+    for stat, count in zip(PIE_CHART_ORDER, counts):
+        if not count:
+            continue
+        if count == totalVuln:
+            # a single severity is a full circle, which an arc can't draw
+            parts.append(
+                f'<circle cx="{PIE_CENTER}" cy="{PIE_CENTER}" r="{PIE_RADIUS}" fill="{PIE_FILLS[stat]}"/>')
+            break
+        sweep = count / totalVuln * 2 * pi
+        angle += sweep
+        x2 = PIE_CENTER + PIE_RADIUS * cos(angle)
+        y2 = PIE_CENTER + PIE_RADIUS * sin(angle)
+        largeArc = 1 if sweep > pi else 0
+        parts.append(
+            f'<path d="M{PIE_CENTER} {PIE_CENTER}L{x1:.2f} {y1:.2f}'
+            f'A{PIE_RADIUS} {PIE_RADIUS} 0 {largeArc} 1 {x2:.2f} {y2:.2f}Z" fill="{PIE_FILLS[stat]}"/>')
+        x1, y1 = x2, y2
+    parts.append('</svg>')
+    return "".join(parts)
+
+
+CAIRO_SURFACE_ID_RE = re.compile(r"\bsurface\d+\b")
+
+
+def draw_pieChart_cairo(counts):
+    import cairo
+
+    totalVuln = sum(counts)
+    # Get percent of all values (an empty host just gets the base circle)
+    percents = [getPercent(c, totalVuln) if totalVuln else 0 for c in counts]
+
+    svgBuffer = io.BytesIO()
+    with cairo.SVGSurface(svgBuffer, 200, 200) as surface:
         context = cairo.Context(surface)
 
         context.scale(200, 200)
@@ -148,19 +212,180 @@ def draw_pieChart(stats):
         context.fill()
 
         lastPoint = 0
-        for stat in stats:
-            statPoint = stats[stat]
+        for stat, statPoint in zip(PIE_CHART_ORDER, percents):
             start = lastPoint
             end = statPoint+start
 
             draw_segment(context, start, end, stat)
             lastPoint += statPoint
-    with open("test.svg", "r") as content:
-        svgContent = content.read()
-    content.close()
-    if os.path.exists("test.svg"):
-        os.remove("test.svg")
-    return svgContent
+    # cairo numbers surfaces with a process wide counter, so the same chart
+    # drawn in a --jobs worker would get a different id than a serial run
+    return CAIRO_SURFACE_ID_RE.sub("surface1", svgBuffer.getvalue().decode())
+
+
+# Chart cache hits/misses reported back by --jobs worker processes
+_chart_cache_workers = {}
+
+
+def chart_cache_stats():
+    info = _draw_pieChart_cached.cache_info()
+    hits = info.hits + sum(h for h, m in _chart_cache_workers.values())
+    misses = info.misses + sum(m for h, m in _chart_cache_workers.values())
+    return hits, misses
+
+
+def intern_text(value):
+    # Synopsis/solution/description text is identical for every host a plugin
+    # fires on, so keep a single copy of each string.
+    return sys.intern(value) if value else ""
+
+
+def as_list(value):
+    # repeated tags come out of element_to_dict as a list, single ones don't
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+class Finding(object):
+    """
+    The parts of a ReportItem the renderers actually use. Everything else
+    in the item (see_also, cvss vectors, xrefs...) is dropped at parse time.
+    """
+
+    __slots__ = ("plugin_id", "plugin_name", "risk_factor", "port", "protocol",
+                 "svc_name", "synopsis", "solution", "description",
+                 "plugin_output", "cvss3", "cves")
+
+    def __init__(self, plugin_id, plugin_name, risk_factor, port, protocol,
+                 svc_name, synopsis="", solution="", description="",
+                 plugin_output="", cvss3=0, cves=()):
+        self.plugin_id = plugin_id
+        self.plugin_name = plugin_name
+        self.risk_factor = risk_factor
+        self.port = port
+        self.protocol = protocol
+        self.svc_name = svc_name
+        self.synopsis = synopsis
+        self.solution = solution
+        self.description = description
+        self.plugin_output = plugin_output
+        self.cvss3 = cvss3
+        self.cves = cves
+
+    @classmethod
+    def from_item(cls, item):
+        # item is a ReportItem dict as produced by element_to_dict
+        return cls(
+            plugin_id=intern_text(item.get('@pluginID')),
+            plugin_name=intern_text(item.get('plugin_name')),
+            risk_factor=intern_text(item.get('risk_factor')),
+            port=intern_text(item.get('@port')),
+            protocol=intern_text(item.get('@protocol')),
+            svc_name=intern_text(item.get('@svc_name')),
+            synopsis=intern_text(item.get('synopsis')),
+            solution=intern_text(item.get('solution')),
+            description=intern_text(item.get('description')),
+            plugin_output=item.get('plugin_output') or "",
+            cvss3=float(item['cvss3_base_score']) if item.get(
+                'cvss3_base_score') else 0,
+            cves=tuple(intern_text(c) for c in as_list(item.get('cve')) if c),
+        )
+
+    def to_dict(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+# Severity ordinals, most severe first. Buckets and sort keys are indexed by
+# a finding's rank in this tuple.
+SEVERITIES = ("Critical", "High", "Medium", "Low", "Info")
+SEVERITY_RANK = {name: rank for rank, name in enumerate(SEVERITIES)}
+
+
+def bucket_by_severity(findings):
+    # one stable pass: buckets[SEVERITY_RANK[x]] keeps the findings' order
+    buckets = [[] for _ in SEVERITIES]
+    for finding in findings:
+        rank = SEVERITY_RANK.get(finding.risk_factor)
+        if rank is not None:
+            buckets[rank].append(finding)
+    return buckets
+
+
+def count_severities(risk_factors):
+    """
+    Count findings per severity from an iterable of risk_factor strings.
+    Returns a fixed-size list indexed by SEVERITY_RANK. Works on Finding
+    objects and raw ReportItem dicts alike, e.g.
+    count_severities(v.risk_factor for v in findings).
+    """
+    counts = [0] * len(SEVERITIES)
+    rank = SEVERITY_RANK.get
+    for risk in risk_factors:
+        i = rank(risk)
+        if i is not None:
+            counts[i] += 1
+    return counts
+
+
+# HOST_START / HOST_END, e.g. "Mon Nov 21 10:00:00 2022"
+HOST_TIME_FORMAT = "%a %b %d %H:%M:%S %Y"
+
+
+def parse_host_time(text):
+    try:
+        return datetime.strptime(text, HOST_TIME_FORMAT) if text else None
+    except ValueError:
+        return None
+
+
+class HostProperties(object):
+    """
+    A ReportHost's <HostProperties>, read into a dict once. The tags the
+    report uses get their own attribute, None when the scan didn't record
+    them; every tag (including those) stays available in tags.
+    """
+
+    __slots__ = ("ip", "fqdn", "netbios", "os", "mac", "start", "end", "tags")
+
+    def __init__(self, tags):
+        self.tags = tags
+        self.ip = tags.get('host-ip')
+        self.fqdn = tags.get('host-fqdn')
+        self.netbios = tags.get('netbios-name')
+        self.os = tags.get('operating-system')
+        self.mac = normalize_mac(tags.get('mac-address'))
+        self.start = parse_host_time(tags.get('HOST_START'))
+        self.end = parse_host_time(tags.get('HOST_END'))
+
+    @classmethod
+    def from_tags(cls, tags):
+        # tags as produced by report_host_to_dict: [{'@name': .., '#text': ..}]
+        return cls({t['@name']: t['#text'] for t in as_list(tags)})
+
+    def merged(self, other):
+        # this host's tags win, other fills the gaps; the scan window
+        # covers both
+        combined = HostProperties({**other.tags, **self.tags})
+        times = [t for t in (self.start, other.start) if t]
+        combined.start = min(times) if times else None
+        times = [t for t in (self.end, other.end) if t]
+        combined.end = max(times) if times else None
+        return combined
+
+    def to_dict(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+def json_default(o):
+    if isinstance(o, (Finding, HostProperties)):
+        return o.to_dict()
+    if isinstance(o, datetime):
+        return o.isoformat()
+    if isinstance(o, Report):
+        # the findings table is derived from the hosts, leave it out
+        return {k: v for k, v in o.__dict__.items() if k != 'table'}
+    return o.__dict__
 
 
 class Host(object):
@@ -172,31 +397,23 @@ class Host(object):
     _critical_count = 0
     _total_count = 0
     _host_ipaddress = None
+    _mac_address = None
     _report_filepath = None
     _start_report = None
     _end_report = None
+    _properties = None
+    _findings_digest = None
+    _buckets = None
 
     def __init__(self, hostname, vulns):
         self._hostname = hostname
         self._vulns = vulns
 
         # update totals
-        for r in self._vulns:
-            for v in r:
-                if v == "risk_factor":
-                    rating = r[v]
-                    if rating == "Info":
-                        self._info_count += 1
-                    if rating == "Low":
-                        self._low_count += 1
-                    if rating == "Medium":
-                        self._medium_count += 1
-                    if rating == "High":
-                        self._high_count += 1
-                    if rating == "Critical":
-                        self._critical_count += 1
-                    self._total_count = self._critical_count + self._high_count + \
-                        self._medium_count + self._low_count + self._info_count
+        counts = count_severities(r.risk_factor for r in self._vulns)
+        (self._critical_count, self._high_count, self._medium_count,
+         self._low_count, self._info_count) = counts
+        self._total_count = sum(counts)
 
     def print_vuln_stats(self):
         return print(f"Critical: {self._critical_count}, High: {self._high_count}, Medium: {self._medium_count}, Low: {self._low_count}, Info: {self._info_count}, Total: {self._total_count}")
@@ -204,553 +421,1425 @@ class Host(object):
     def getTotal(self):
         return self._total_count
 
+    def severity_buckets(self):
+        # worked out on first use and shared by every page that needs it
+        if self._buckets is None:
+            self._buckets = bucket_by_severity(self._vulns)
+        return self._buckets
+
+    def worst_severity(self):
+        # rank of the most severe finding, None for a host without findings
+        counts = (self._critical_count, self._high_count, self._medium_count,
+                  self._low_count, self._info_count)
+        return next((rank for rank, c in enumerate(counts) if c), None)
+
     def toJSON(self):
-        return json.dumps(self, default=lambda o: o.__dict__,
-                          sort_keys=True)
+        return json.dumps(self, default=json_default, sort_keys=True)
+
+
+class FindingsTable(object):
+    """
+    Column store of every finding in a Report: host index, plugin id,
+    severity rank, port and cvss3 score. Columns are appended to while
+    parsing and handed out as numpy arrays, so report wide counts are
+    bincount/unique calls rather than loops over Host and Finding objects.
+    """
+
+    def __init__(self):
+        self._host = array('i')
+        self._plugin = array('i')
+        self._severity = array('b')
+        self._port = array('i')
+        self._cvss3 = array('f')
+        self.hostnames = []
+        self.plugin_names = {}
+        self._arrays = None
+
+    def add_host(self, hostname, findings):
+        # the numpy views from columns() share the arrays' buffers, which
+        # can't grow while they are alive: drop them before appending
+        self._arrays = None
+        hostIndex = len(self.hostnames)
+        self.hostnames.append(hostname)
+        for finding in findings:
+            rank = SEVERITY_RANK.get(finding.risk_factor)
+            if rank is None:
+                continue
+            pluginId = int(finding.plugin_id or 0)
+            self.plugin_names.setdefault(pluginId, finding.plugin_name)
+            self._host.append(hostIndex)
+            self._plugin.append(pluginId)
+            self._severity.append(rank)
+            self._port.append(int(finding.port or 0))
+            self._cvss3.append(finding.cvss3)
+
+    def __len__(self):
+        return len(self._severity)
+
+    def columns(self):
+        # (host, plugin, severity, port, cvss3) as numpy arrays
+        if self._arrays is None:
+            self._arrays = (np.frombuffer(self._host, dtype=np.int32),
+                            np.frombuffer(self._plugin, dtype=np.int32),
+                            np.frombuffer(self._severity, dtype=np.int8),
+                            np.frombuffer(self._port, dtype=np.int32),
+                            np.frombuffer(self._cvss3, dtype=np.float32))
+        return self._arrays
+
+    def severity_totals(self):
+        # findings per severity, indexed by SEVERITY_RANK
+        host, plugin, severity, port, cvss3 = self.columns()
+        return np.bincount(severity, minlength=len(SEVERITIES))
+
+    def host_severity_counts(self):
+        # (hosts x severities) matrix of finding counts
+        host, plugin, severity, port, cvss3 = self.columns()
+        width = len(SEVERITIES)
+        counts = np.bincount(host.astype(np.int64) * width + severity,
+                             minlength=len(self.hostnames) * width)
+        return counts.reshape(len(self.hostnames), width)
+
+    def top_plugins(self, n=10, max_rank=len(SEVERITIES) - 1):
+        # [(plugin_id, plugin_name, count)] of the n most common plugins at
+        # or above the given severity rank
+        host, plugin, severity, port, cvss3 = self.columns()
+        ids, counts = np.unique(plugin[severity <= max_rank], return_counts=True)
+        order = np.argsort(-counts, kind='stable')[:n]
+        return [(int(ids[i]), self.plugin_names[int(ids[i])], int(counts[i])) for i in order]
+
+    def port_histogram(self, max_rank=len(SEVERITIES) - 1):
+        # {port: findings on that port} at or above the given severity rank
+        host, plugin, severity, port, cvss3 = self.columns()
+        ports, counts = np.unique(port[severity <= max_rank], return_counts=True)
+        return dict(zip(ports.tolist(), counts.tolist()))
+
+    def __getstate__(self):
+        # numpy views of the columns are rebuilt after unpickling
+        state = self.__dict__.copy()
+        state['_arrays'] = None
+        return state
 
 
 class Report(object):
     def __init__(self):
         self.hosts = []
+        self.table = FindingsTable()
 
     def host_count(self):
         return len(self.hosts)
 
-    def add_report(self, host, vulns, ip):
+    def add_report(self, host, vulns, ip, mac=None, properties=None):
         host = Host(host, vulns)
         host._host_ipaddress = ip
+        host._mac_address = mac
+        if properties is not None:
+            host._properties = properties
+            host._start_report = properties.start
+            host._end_report = properties.end
         # host.print_vuln_stats()
+        self.add_host(host)
+
+    def add_host(self, host):
         self.hosts.append(host)
+        self.table.add_host(host._hostname, host._vulns)
 
     def all_reports(self):
         return self.hosts
 
     def toJSON(self):
-        return json.dumps(self, default=lambda o: o.__dict__,
-                          sort_keys=True)
+        return json.dumps(self, default=json_default, sort_keys=True)
+
 
+# |||NAME||| markers in the html templates. The findings marker is written
+# |||REPLACEME|||| in the templates, so swallow an optional fourth pipe.
+PLACEHOLDER_RE = re.compile(r"\|\|\|([A-Z][A-Z0-9_\-]*)\|\|\|\|?")
 
-def build_AccordionItem(vulnerability, synopsis, id):
 
-    synopsis = synopsis.replace("\n", "<br>")
+class Template(object):
+    """
+    A template split once at its |||PLACEHOLDER||| markers. Rendering joins
+    the static fragments with the values in a single pass instead of running
+    one str.replace over the whole page per placeholder.
+    """
+
+    def __init__(self, text, rewrite=None):
+        self._fragments = []
+        self._names = []
+        self._markers = []
+        pos = 0
+        for match in PLACEHOLDER_RE.finditer(text):
+            self._fragments.append(text[pos:match.start()])
+            self._names.append(match.group(1))
+            self._markers.append(match.group(0))
+            pos = match.end()
+        self._fragments.append(text[pos:])
+        # rewrite only touches the template's own markup, never the values
+        for old, new in (rewrite or {}).items():
+            self._fragments = [f.replace(old, new) for f in self._fragments]
+
+    @classmethod
+    def from_file(cls, path, rewrite=None):
+        with open(path, 'r') as template:
+            return cls(template.read(), rewrite)
+
+    def render(self, values):
+        # placeholders without a value are left in the page as they were
+        parts = [self._fragments[0]]
+        for name, marker, fragment in zip(self._names, self._markers, self._fragments[1:]):
+            parts.append(str(values[name]) if name in values else marker)
+            parts.append(fragment)
+        return "".join(parts)
+
+    def render_to(self, fh, values):
+        """
+        Same as render() but written straight to an open file. A value may
+        also be an iterable of strings (e.g. a generator), which is written
+        chunk by chunk so it never has to exist as one string.
+        """
+        fh.write(self._fragments[0])
+        for name, marker, fragment in zip(self._names, self._markers, self._fragments[1:]):
+            value = values[name] if name in values else marker
+            if isinstance(value, str) or not hasattr(value, '__iter__'):
+                fh.write(str(value))
+            else:
+                for chunk in value:
+                    fh.write(chunk)
+            fh.write(fragment)
+
+
+@functools.lru_cache(maxsize=None)
+def load_template(path, relative_assets=False):
+    # host pages live one folder down, so point them back at ../assets/
+    rewrite = {"assets/": "../assets/"} if relative_assets else None
+    return Template.from_file(path, rewrite)
+
+
+def build_AccordionItem(vulnerability, synopsis, id, title=None, shard=None):
+    # synopsis is markup already escaped by get_*_synopsis, title is text
+    title = escape_shared(vulnerability.plugin_name if title is None else title)
+    # --lazy-bodies: the body is left empty and filled from the host's shard
+    bodyAttrs = f' data-shard="{shard[0]}" data-index="{shard[1]}"' if shard else ""
 
     accodrionItemHTML = f"""
     <div class="accordion" id="accordion" role="tablist">
      <div class="accordion-item"> <div class="accordion-header" role="tab">
      <button class="accordion-button collapsed ui-state-hover" type="button" data-bs-toggle="collapse" data-bs-target="#accordion .item-{id}" aria-expanded="false" aria-controls="accordion .item-{id}">
-     <span class="vulnlabel {vulnerability['risk_factor'].lower()}">{vulnerability['risk_factor'].upper()}</span>&nbsp;{vulnerability['plugin_name']}
+     <span class="vulnlabel {vulnerability.risk_factor.lower()}">{vulnerability.risk_factor.upper()}</span>&nbsp;{title}
      </button> </div> <div class="accordion-collapsed collapse item-{id}" role="tabpanel" data-bs-parent="#accordion">
-     <div class="accordion-body"> <p>{synopsis}</p> </div> </div> </div> </div>"""
+     <div class="accordion-body"{bodyAttrs}> <p>{synopsis}</p> </div> </div> </div> </div>"""
     return accodrionItemHTML
 
 
+# --lazy-bodies: finding bodies are written to one shard per host under
+# shards/, as a json array wrapped in a pynessShard(...) call. A script tag
+# can load that from a report opened straight off disk, where fetch() of a
+# local .json file is blocked by the browser.
+SHARDS_FOLDER = "shards"
+LAZY_LOADER_JS = "pyness-lazy.js"
+LAZY_LOADER_SCRIPT = f'<script src="../assets/js/{LAZY_LOADER_JS}"></script>'
+LAZY_LOADER_SOURCE = """// Fills accordion bodies from the per host shards when they are opened.
+(function () {
+    var shards = {};
+    var pending = {};
+
+    function fill(body) {
+        var data = shards[body.getAttribute("data-shard")];
+        body.innerHTML = "<p>" + data[+body.getAttribute("data-index")] + "</p>";
+        body.removeAttribute("data-shard");
+    }
+
+    window.pynessShard = function (name, bodies) {
+        shards[name] = bodies;
+        (pending[name] || []).forEach(fill);
+        delete pending[name];
+    };
+
+    document.addEventListener("show.bs.collapse", function (event) {
+        var body = event.target.querySelector(".accordion-body[data-shard]");
+        if (!body) {
+            return;
+        }
+        var name = body.getAttribute("data-shard");
+        if (shards[name]) {
+            fill(body);
+            return;
+        }
+        if (!pending[name]) {
+            pending[name] = [];
+            var script = document.createElement("script");
+            script.src = "../shards/" + encodeURIComponent(name) + ".js";
+            document.body.appendChild(script);
+        }
+        pending[name].push(body);
+    });
+})();
+"""
+
+
+def write_lazy_loader(assets_directory):
+    jsDir = os.path.join(assets_directory, "js")
+    os.makedirs(jsDir, exist_ok=True)
+    with open(os.path.join(jsDir, LAZY_LOADER_JS), 'w') as f:
+        f.write(LAZY_LOADER_SOURCE)
+
+
+def write_host_shard(report_directory, stem, bodies):
+    # bodies may be a generator, each one is written as it is built
+    shardPath = os.path.join(report_directory, SHARDS_FOLDER, f"{stem}.js")
+    with open(shardPath, 'w', encoding='utf-8') as f:
+        f.write(f"pynessShard({json.dumps(stem)},[")
+        for i, body in enumerate(bodies):
+            f.write(f"{',' if i else ''}{json.dumps(body)}")
+        f.write("]);\n")
+
+
 def sort_vlun_list(reportIn: Report):
-    newVulnList = []
-    # Order vulnlist by rating, infos first, criticals last
-    allInfos = [
-        x for x in reportIn._vulns if x['risk_factor'] == "Info"]
-    allLowss = [
-        x for x in reportIn._vulns if x['risk_factor'] == "Low"]
-    allMediumss = [
-        x for x in reportIn._vulns if x['risk_factor'] == "Medium"]
-    allHighs = [
-        x for x in reportIn._vulns if x['risk_factor'] == "High"]
-    allCriticalss = [
-        x for x in reportIn._vulns if x['risk_factor'] == "Critical"]
-    newVulnList.extend(allCriticalss)
-    newVulnList.extend(allHighs)
-    newVulnList.extend(allMediumss)
-    newVulnList.extend(allLowss)
-    newVulnList.extend(allInfos)
-    return newVulnList
-
-
-def create_vulnbyHost(reportClass, template_file, report_directory, options):
-
-    for report in reportClass.hosts:
-        vulnList = sort_vlun_list(report)
-
-        print(report._hostname)
-
-        with open(template_file, 'r') as template:
-            contents = template.read()
-
-        htmlParts = []
-        idCount = 0
-        for v in vulnList:
-            if not v:
-                continue
-            # synopsisCode = get_vuln_synopsis(v)
-            # htmlPart = f"<button class=\"accordion {str(v['risk_factor']).lower()}\">{v['plugin_name']}</button>"
-            # htmlPart += f"<div class=\"accordion-content\"><p>{synopsisCode}</p></div>"
-            # htmlParts.append(htmlPart)
-            # {str(v['risk_factor']).lower()}
-            _host_ipaddress = report._host_ipaddress
-            # riskFactor = str(v['risk_factor']).lower()
-            synopsisCode = get_vuln_synopsis(v, _host_ipaddress)
-            # htmlPart = f"<button class=\"accordion\"><span class=\"vulnlabel {riskFactor}\">{riskFactor.upper()}</span>{v['plugin_name']}</button>"
-            # htmlPart += f"<div class=\"accordion-content\"><p>{synopsisCode}</p></div>"
-            htmlPart = build_AccordionItem(v, synopsisCode, idCount)
-            htmlParts.append(htmlPart)
-            idCount += 1
-            print(v['plugin_name'])
-        contents = contents.replace(
-            "|||TOTALFINDINGS|||", str(report._total_count))
-        contents = contents.replace(
-            "|||TOTALCRITICAL|||", str(report._critical_count))
-        contents = contents.replace("|||TOTALHIGH|||", str(report._high_count))
-        contents = contents.replace(
-            "|||TOTALMEDIUM|||", str(report._medium_count))
-        contents = contents.replace("|||TOTALLOW|||", str(report._low_count))
-        contents = contents.replace(
-            "|||TOTALINFORMATION|||", str(report._info_count))
-
-        contents = contents.replace(
-            "|||COMPANYNAME|||", options['customerName'])
+    # Order vulnlist by rating, criticals first, infos last
+    return itertools.chain.from_iterable(reportIn.severity_buckets())
+
+
+SAVE_VULNSBYHOST_FOLDER = "host_reports"
 
-        # Findings
-        contents = contents.replace("|||REPLACEME||||", ''.join(htmlParts))
-        # Hostname or IP
-        contents = contents.replace(
-            "|||HOSTNAME_IP|||", str(report._hostname).upper())
 
-        # pie chart
-        inputVars = {"critical": report._critical_count, "high": report._high_count,
-                     "medium": report._medium_count, "low": report._low_count, "info": report._total_count}
-        imageText = draw_pieChart(inputVars)
+def host_page_stem(report):
+    # file name (without .html) of a host's page, also used to key the host
+    # in the report manifest
+    return report._hostname.replace('.', '_').replace('-', '_')
 
-        contents = contents.replace("|||PIE-CHART|||", imageText)
-        # add extra ../ to go back for assets files
-        contents = contents.replace("assets/", "../assets/")
-        # ------------------------------------------------------
-        FILENAME = rf"{report._hostname.replace('.', '_').replace('-','_')}.html"
-        SAVE_VULNSBYHOST_FOLDER = "host_reports"
 
-        if not os.path.exists(report_directory):
-            os.mkdir(report_directory)
-        report_dir = os.path.join(report_directory, SAVE_VULNSBYHOST_FOLDER)
-        if not os.path.exists(report_dir):
-            os.mkdir(report_dir)
+def accordion_id_prefix(stem):
+    # accordion ids end up in a css selector (data-bs-target), so anything
+    # a selector can't take unescaped, like the colons of an IPv6 host
+    # name, is spelled out as its code point
+    return re.sub(r"[^A-Za-z0-9_]", lambda m: f"_{ord(m.group()):x}_", stem)
 
-        report_dir = os.path.join(report_directory, SAVE_VULNSBYHOST_FOLDER)
-        fullP = os.path.realpath(report_dir)
-        SAVE_FILE = os.path.join(fullP, FILENAME)
+# Worker state for --jobs, set once per process by _init_host_worker so the
+# parsed hosts are shipped to each worker once, not once per page.
+_worker_state = {}
 
-        LOCALPATH = f".\{SAVE_VULNSBYHOST_FOLDER}\{FILENAME}"
 
-        report._report_filepath = LOCALPATH
+def iter_host_page_items(report, lazy=False):
+    # accordions for the host page, each built only as the page is written
+    stem = host_page_stem(report)
+    for idCount, v in enumerate(sort_vlun_list(report)):
+        print(v.plugin_name)
+        if lazy:
+            yield build_AccordionItem(v, "", idCount, shard=(stem, idCount))
+        else:
+            yield build_AccordionItem(v, get_vuln_synopsis(v, report._host_ipaddress), idCount)
+    if lazy:
+        yield LAZY_LOADER_SCRIPT
 
-        with open(SAVE_FILE, 'w') as file:
-            file.write(contents)
 
+def render_host_page(report, template_file, report_directory, options):
+    lazy = options.get('lazy_bodies')
+    stem = host_page_stem(report)
 
-def cleanString(string):
-    string = string.replace("<", "LT")
-    string = string.replace(">", "GT")
-    string = string.replace("`n", "<br />")
-    return string
+    print(report._hostname)
+
+    if lazy:
+        write_host_shard(report_directory, stem,
+                         (get_vuln_synopsis(v, report._host_ipaddress) for v in sort_vlun_list(report)))
+
+    # pie chart
+    inputVars = {"critical": report._critical_count, "high": report._high_count,
+                 "medium": report._medium_count, "low": report._low_count, "info": report._total_count}
+    imageText = draw_pieChart(
+        inputVars, options.get('chart_backend', DEFAULT_CHART_BACKEND))
+
+    template = load_template(template_file, relative_assets=True)
+    values = {
+        "TOTALFINDINGS": report._total_count,
+        "TOTALCRITICAL": report._critical_count,
+        "TOTALHIGH": report._high_count,
+        "TOTALMEDIUM": report._medium_count,
+        "TOTALLOW": report._low_count,
+        "TOTALINFORMATION": report._info_count,
+        "COMPANYNAME": options['customerName'],
+        # Findings
+        "REPLACEME": iter_host_page_items(report, lazy),
+        # Hostname or IP
+        "HOSTNAME_IP": escape_html(str(report._hostname).upper()),
+        "PIE-CHART": imageText,
+    }
+    FILENAME = f"{stem}.html"
+    report_dir = os.path.join(report_directory, SAVE_VULNSBYHOST_FOLDER)
+    fullP = os.path.realpath(report_dir)
+    SAVE_FILE = os.path.join(fullP, FILENAME)
+
+    LOCALPATH = f".\{SAVE_VULNSBYHOST_FOLDER}\{FILENAME}"
+
+    with open(SAVE_FILE, 'w') as file:
+        template.render_to(file, values)
+    return LOCALPATH
+
+
+def _init_host_worker(reportClass, template_file, report_directory, options):
+    _worker_state['args'] = (reportClass, template_file,
+                             report_directory, options)
+
+
+def _render_host_worker(index):
+    reportClass, template_file, report_directory, options = _worker_state['args']
+    path = render_host_page(reportClass.hosts[index], template_file,
+                            report_directory, options)
+    info = _draw_pieChart_cached.cache_info()
+    return path, os.getpid(), info.hits, info.misses
+
+
+def create_vulnbyHost(reportClass, template_file, report_directory, options, previous=None):
+    report_dir = os.path.join(report_directory, SAVE_VULNSBYHOST_FOLDER)
+    os.makedirs(report_dir, exist_ok=True)
+    if options.get('lazy_bodies'):
+        os.makedirs(os.path.join(report_directory, SHARDS_FOLDER), exist_ok=True)
+
+    # With a previous manifest (--update) hosts whose findings haven't
+    # changed keep the page that is already on disk.
+    todo = []
+    for index, report in enumerate(reportClass.hosts):
+        old = previous['hosts'].get(host_page_stem(report)) if previous else None
+        if old and old['digest'] == host_digest(report) and \
+                os.path.exists(os.path.join(report_dir, f"{host_page_stem(report)}.html")):
+            report._report_filepath = old['path']
+        else:
+            todo.append(index)
+    if previous:
+        current = {host_page_stem(r) for r in reportClass.hosts}
+        for stem in previous['hosts'].keys() - current:
+            for stale in (os.path.join(report_dir, f"{stem}.html"),
+                          os.path.join(report_directory, SHARDS_FOLDER, f"{stem}.js")):
+                if os.path.exists(stale):
+                    os.remove(stale)
+        print(f"Re-rendering {len(todo)} of {len(reportClass.hosts)} host pages")
+
+    jobs = options.get('jobs') or 1
+    if jobs <= 1 or len(todo) <= 1:
+        for index in todo:
+            report = reportClass.hosts[index]
+            report._report_filepath = render_host_page(
+                report, template_file, report_directory, options)
+        return
+
+    # Pages are rendered by index and collected with map(), so the order (and
+    # the file each host gets) is the same as in serial mode.
+    chunksize = max(1, len(todo) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_host_worker,
+                             initargs=(reportClass, template_file, report_directory, options)) as pool:
+        results = pool.map(_render_host_worker, todo, chunksize=chunksize)
+        for index, (path, pid, hits, misses) in zip(todo, results):
+            reportClass.hosts[index]._report_filepath = path
+            # cache counters only grow, keep the latest seen per worker
+            _chart_cache_workers[pid] = max(
+                _chart_cache_workers.get(pid, (0, 0)), (hits, misses))
+
+
+# Nessus text goes into the page as-is apart from these: markup characters
+# are escaped and line breaks (real ones, or the literal `n some plugins
+# emit) become <br>, all in one pass over the string.
+HTML_ESCAPES = {"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;",
+                "'": "&#x27;", "`n": "<br>", "\r\n": "<br>", "\n": "<br>"}
+HTML_ESCAPE_RE = re.compile("|".join(re.escape(k) for k in sorted(HTML_ESCAPES, key=len, reverse=True)))
+
+
+def escape_html(string):
+    if not string:
+        return ""
+    return HTML_ESCAPE_RE.sub(lambda m: HTML_ESCAPES[m.group()], str(string))
+
+
+# Plugin names, synopses, solutions and descriptions are the same interned
+# strings on every host a plugin fires on, so they are only escaped once.
+# Plugin output is per finding and goes through escape_html directly.
+escape_shared = functools.lru_cache(maxsize=16384)(escape_html)
 
 
 def get_vuln_synopsis(vuln, ip):
     # aa
-    synopsis = vuln['synopsis']
-    solution = vuln['solution']
+    synopsis = escape_shared(vuln.synopsis)
+    solution = escape_shared(vuln.solution)
 
     classtype = "HOLDER"
     _host_ipaddress = ip
-    port = vuln['@port']
-    protocol = vuln['@protocol']
-    servicename = vuln['@svc_name']
-    description = vuln['description']
-    pluginoutput = vuln['plugin_output'] if "plugin_output" in vuln else ""
+    port = escape_html(vuln.port)
+    protocol = escape_html(vuln.protocol)
+    servicename = escape_html(vuln.svc_name)
+    description = escape_shared(vuln.description)
+    pluginoutput = escape_html(vuln.plugin_output)
     # systeminfo
     retHTML = "<div><strong>Summary Information</strong><br /><br />"
     retHTML += "<table><tr><td>Synopsis</td><td>"
-    retHTML += f"{cleanString(synopsis)}</td></tr><tr><td>Solution</td><td>"
-    retHTML += f"{cleanString(solution)}</td></tr></table><br /><br /><strong>Details By Port</strong><br /><br /></div>"
+    retHTML += f"{synopsis}</td></tr><tr><td>Solution</td><td>"
+    retHTML += f"{solution}</td></tr></table><br /><br /><strong>Details By Port</strong><br /><br /></div>"
 
     retHTML += "<table>"
     retHTML += f"<tr class=\"{classtype}\"><td>IP Address</td><td>"
-    retHTML += f"{_host_ipaddress}</td></tr><tr><td>Port/Protocol</td><td>{port}/{protocol}/{servicename}</td></tr>"
+    retHTML += f"{escape_html(_host_ipaddress)}</td></tr><tr><td>Port/Protocol</td><td>{port}/{protocol}/{servicename}</td></tr>"
     retHTML += "<tr><td>Description</td>"
-    retHTML += f"<td class=\"tddesc\"><div class=\"divtoggle\">{cleanString(description)}</div><div class=\"link toggle\"/></td></tr>"
+    retHTML += f"<td class=\"tddesc\"><div class=\"divtoggle\">{description}</div><div class=\"link toggle\"/></td></tr>"
     retHTML += "<tr><td>Output</td>"
-    retHTML += f"<td class=\"tdoutput\"><div class=\"divtoggle\">{cleanString(pluginoutput)}</div><div class=\"link toggle\" /></td></tr></table><br /><br />"
+    retHTML += f"<td class=\"tdoutput\"><div class=\"divtoggle\">{pluginoutput}</div><div class=\"link toggle\" /></td></tr></table><br /><br />"
+
+    return retHTML
 
+
+def get_plugin_group_synopsis(vuln, affected):
+    # One plugin's shared text, then every (host, finding) it fired on
+    retHTML = "<div><strong>Summary Information</strong><br /><br />"
+    retHTML += "<table><tr><td>Synopsis</td><td>"
+    retHTML += f"{escape_shared(vuln.synopsis)}</td></tr><tr><td>Solution</td><td>"
+    retHTML += f"{escape_shared(vuln.solution)}</td></tr><tr><td>Description</td>"
+    retHTML += f"<td class=\"tddesc\"><div class=\"divtoggle\">{escape_shared(vuln.description)}</div><div class=\"link toggle\"/></td></tr></table>"
+    retHTML += f"<br /><br /><strong>Affected Hosts ({len(affected)})</strong><br /><br /></div>"
+
+    retHTML += "<table><tr><th>Host</th><th>IP Address</th><th>Port/Protocol</th></tr>"
+    retHTML += "".join(
+        f"<tr><td>{escape_html(host._hostname)}</td><td>{escape_html(host._host_ipaddress)}</td>"
+        f"<td>{escape_html(v.port)}/{escape_html(v.protocol)}/{escape_html(v.svc_name)}</td></tr>"
+        for host, v in affected)
+    retHTML += "</table><br /><br />"
     return retHTML
 
 
-def get_data_from_NessusFile(nessusFile):
-    with open(nessusFile) as xml_file:
-        data_dict = xmltodict.parse(xml_file.read())
-    # Put json into a string, then load again to parse the structure
-    json_string = json.dumps(data_dict)
-    json_data = json.loads(json_string)
-    NessusData = json_data['NessusClientData_v2']
-    return NessusData
+def element_text(elem):
+    # like xmltodict: surrounding whitespace stripped, None when empty
+    return (elem.text or "").strip() or None
+
+
+def element_to_dict(elem):
+    """
+    Convert a ReportItem (or any flat element) to the same shape xmltodict
+    gave us: attributes as '@name', child tags as text, repeated tags as lists.
+    """
+    item = {f"@{k}": v for k, v in elem.attrib.items()}
+    for child in elem:
+        text = element_text(child)
+        if child.tag in item:
+            if not isinstance(item[child.tag], list):
+                item[child.tag] = [item[child.tag]]
+            item[child.tag].append(text)
+        else:
+            item[child.tag] = text
+    return item
+
+
+def report_host_to_dict(elem):
+    tags = [{'@name': t.get('name'), '#text': element_text(t)}
+            for t in elem.iterfind('HostProperties/tag')]
+    return {
+        '@name': elem.get('name'),
+        'HostProperties': {'tag': tags},
+        'ReportItem': [element_to_dict(x) for x in elem.iterfind('ReportItem')],
+    }
+
+
+class ReportItemFilter(object):
+    """
+    The --min-severity / --exclude-plugin / --include-family / --port
+    options, checked against a <ReportItem>'s attributes while the file is
+    streamed, so dropped items never become dicts or Findings. The severity
+    test applies the same cvss3 > 8.9 -> Critical rule as the normalize
+    stages.
+    """
+
+    def __init__(self, min_severity=None, exclude_plugins=(), include_families=(), ports=()):
+        # severity attribute: 0 Info .. 4 Critical, the reverse of SEVERITY_RANK
+        self.min_level = (len(SEVERITIES) - 1 - SEVERITY_RANK[min_severity]) if min_severity else 0
+        self.exclude_plugins = frozenset(str(p) for p in exclude_plugins)
+        self.include_families = frozenset(f.lower() for f in include_families)
+        self.ports = frozenset(str(p) for p in ports)
+
+    @classmethod
+    def from_options(cls, options):
+        return cls(options.get('min_severity'), options.get('exclude_plugin') or (),
+                   options.get('include_family') or (), options.get('port') or ())
+
+    def __bool__(self):
+        return bool(self.min_level or self.exclude_plugins or
+                    self.include_families or self.ports)
+
+    def key(self):
+        # part of the scan cache key
+        return (f"{self.min_level}|{sorted(self.exclude_plugins)}|"
+                f"{sorted(self.include_families)}|{sorted(self.ports)}")
+
+    def accepts(self, elem):
+        if self.exclude_plugins and elem.get('pluginID') in self.exclude_plugins:
+            return False
+        if self.include_families and (elem.get('pluginFamily') or "").lower() not in self.include_families:
+            return False
+        if self.ports and elem.get('port') not in self.ports:
+            return False
+        if int(elem.get('severity') or 0) < self.min_level:
+            try:
+                return float(elem.findtext('cvss3_base_score') or 0) > 8.9
+            except ValueError:
+                return False
+        return True
+
+
+def iter_report_hosts(nessusFile, item_filter=None):
+    """
+    Stream a .nessus file and yield one ReportHost (as a dict) at a time.
+    Each host element is cleared once it has been converted, so peak memory
+    depends on the largest single host rather than the whole scan.
+    ReportItems item_filter rejects are dropped as soon as they are read.
+    """
+    parents = []
+    for event, elem in ET.iterparse(nessusFile, events=("start", "end")):
+        if event == "start":
+            parents.append(elem)
+            continue
+        parents.pop()
+        if elem.tag == "ReportItem":
+            if item_filter and not item_filter.accepts(elem) and parents:
+                elem.clear()
+                parents[-1].remove(elem)
+        elif elem.tag == "ReportHost":
+            yield report_host_to_dict(elem)
+            elem.clear()
+            # drop the (now empty) host from <Report> so it doesn't pile up
+            if parents:
+                parents[-1].remove(elem)
+        elif elem.tag == "Policy":
+            elem.clear()
+
+
+# Per finding rules, run lazily as each ReportItem is read:
+#   read -> normalize -> enrich -> filter -> sink (the Host)
+# normalize and enrich stages take (finding, properties) and return the
+# finding, filter stages return False to drop it. Stages run in the order
+# they were registered, so extra rules are a decorated function away.
+FINDING_PHASES = ("normalize", "enrich", "filter")
+FINDING_STAGES = {phase: [] for phase in FINDING_PHASES}
+
+
+def finding_stage(phase):
+    if phase not in FINDING_STAGES:
+        raise ValueError(f"unknown finding phase {phase!r}, expected one of {FINDING_PHASES}")
+
+    def register(func):
+        FINDING_STAGES[phase].append(func)
+        return func
+    return register
+
+
+def finding_stage_names():
+    # part of the scan cache key: other stages, other parse
+    return [f"{phase}:{stage.__module__}.{stage.__qualname__}"
+            for phase in FINDING_PHASES for stage in FINDING_STAGES[phase]]
+
+
+@finding_stage("normalize")
+def risk_none_to_info(vuln, properties):
+    # Change and update the value for None to Info
+    if vuln.risk_factor == 'None':
+        vuln.risk_factor = "Info"
+    return vuln
+
+
+@finding_stage("normalize")
+def cvss3_critical(vuln, properties):
+    # If Risk = High and Cvss3 score > 8.9 Rate CRITICAL
+    if vuln.cvss3 > 8.9:
+        vuln.risk_factor = "Critical"
+    return vuln
+
+
+def finding_pipeline(items, properties):
+    # one generator chain per host; nothing runs until the sink pulls on it
+    findings = map(Finding.from_item, items)
+    for phase in ("normalize", "enrich"):
+        for stage in FINDING_STAGES[phase]:
+            findings = map(functools.partial(stage, properties=properties), findings)
+    for stage in FINDING_STAGES["filter"]:
+        findings = filter(functools.partial(stage, properties=properties), findings)
+    return findings
 
 
 def parse_reports(reportData):
     reportClass = Report()
     # _host_ipaddress = [x for x in NessusData['Report']['ReportHost']['HostProperties']]
     for report in reportData:
-        listofVulns = []
-
-        _host_ipaddress = [x['#text'] for x in report['HostProperties']
-                           ['tag'] if x['@name'] == "host-ip"][0]
-
-        HOST_START = [x['#text'] for x in report['HostProperties']
-                      ['tag'] if x['@name'] == "HOST_START"][0]
-
-        HOST_END = [x['#text'] for x in report['HostProperties']
-                     ['tag'] if x['@name'] == "HOST_END"][0]
+        # missing tags (not every scan can see the MAC, say) come back as None
+        properties = HostProperties.from_tags(report['HostProperties']['tag'])
 
         reportName = report['@name']
-        reportItem = report['ReportItem']
         # print(f"HostName: {reportName}")
-        # reportClass._host_ipaddress = _host_ipaddress
-        for vuln in reportItem:
-            # Cvss3 Score
-            cvss3_score = float(vuln['cvss3_base_score']) if (
-                'cvss3_base_score' in vuln) else 0  # check if the key exists else set 0
-            # Risk Factor
-            riskFactor = vuln['risk_factor']
-            # Change and update the value for None to Low
-            riskFactor = "Info" if riskFactor == 'None' else riskFactor
-            vuln['risk_factor'] = riskFactor
-            # If Risk = High and Cvss3 score > 8.9 Rate CRITICAL
-            if cvss3_score > 8.9:
-                vuln['risk_factor'] = "Critical"
-                riskFactor = vuln['risk_factor']
-            # Set risk totals (info, low, medium, high, critical)
-            # plugin_name = vuln['plugin_name']
-            listofVulns.append(vuln)
-        reportClass.add_report(reportName, listofVulns, _host_ipaddress)
+        listofVulns = list(finding_pipeline(report['ReportItem'], properties))
+        reportClass.add_report(reportName, listofVulns,
+                               properties.ip, properties.mac, properties)
     return reportClass
 
 
-def get_reports(nessusFile):
-    Report = get_data_from_NessusFile(nessusFile)['Report']
-    Reports = Report['ReportHost']
-    reportData = parse_reports(Reports)
-# # Save json to a file for testing
-#     with open("reportData.json", "w") as w:
-#         jsonstr = json.dumps(reportData.toJSON())
-#         jsonout = json.loads(jsonstr)
-#         w.write(jsonout)
+# Bump when Report/Host/Finding change shape so old cache files are ignored
+SCAN_CACHE_VERSION = 6
+
+
+def file_digest(path):
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def scan_cache_path(nessusFile, cache_dir, item_filter=None):
+    # <path hash>-<key hash>.pickle: the path hash prefix lets
+    # save_cached_reports find older entries for the same scan file
+    st = os.stat(nessusFile)
+    path = os.path.abspath(nessusFile)
+    key = (f"{SCAN_CACHE_VERSION}|{path}|{st.st_size}|{st.st_mtime_ns}|"
+           f"{','.join(finding_stage_names())}|{item_filter.key() if item_filter else ''}")
+    prefix = hashlib.blake2b(path.encode(), digest_size=8).hexdigest()
+    name = hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+    return os.path.join(cache_dir, f"{prefix}-{name}.pickle")
+
+
+def load_cached_reports(cachePath, contentHash):
+    """
+    A cache file holds two pickles: the content hash of the scan it was made
+    from, then the parsed Report. The Report is only unpickled if the hash
+    still matches.
+
+    Unpickling runs whatever code a cache file asks for, so --cache-dir must
+    be a directory only trusted users can write to.
+    """
+    try:
+        with open(cachePath, 'rb') as f:
+            if pickle.load(f) != contentHash:
+                return None
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError):
+        return None
+
+
+def save_cached_reports(cachePath, contentHash, reportData):
+    os.makedirs(os.path.dirname(cachePath), exist_ok=True)
+    tmpPath = f"{cachePath}.{os.getpid()}.tmp"
+    with open(tmpPath, 'wb') as f:
+        pickle.dump(contentHash, f, protocol=5)
+        pickle.dump(reportData, f, protocol=5)
+    os.replace(tmpPath, cachePath)
+    # a scan file keeps one entry: whatever was cached for it before (older
+    # contents, another filter) goes, so re-runs don't pile up pickles
+    prefix = os.path.basename(cachePath).split('-')[0]
+    for stale in glob.glob(os.path.join(os.path.dirname(cachePath), f"{prefix}-*.pickle")):
+        if stale != cachePath:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+
+def get_reports(nessusFile, cache_dir=None, item_filter=None):
+    # With a cache_dir, re-runs on an unchanged scan skip the xml parse
+    if cache_dir:
+        cachePath = scan_cache_path(nessusFile, cache_dir, item_filter)
+        contentHash = file_digest(nessusFile)
+        reportData = load_cached_reports(cachePath, contentHash)
+        if reportData is not None:
+            print(f"Loaded parsed scan from cache: {cachePath}")
+            return reportData
+    reportData = parse_reports(iter_report_hosts(nessusFile, item_filter))
+    if cache_dir:
+        save_cached_reports(cachePath, contentHash, reportData)
     return reportData
 
 
-def replace_value_in_file(filename, replace_key, replace_value):
-    with open(filename, "r") as r:
-        content = r.read()
-    content = str(content).replace(replace_key, str(replace_value))
-    with open(filename, "w") as w:
-        w.write(content)
+def expand_input_files(patterns):
+    # -i takes files and globs (Windows shells don't expand them for us)
+    files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        for path in matches:
+            if path not in files:
+                files.append(path)
+    return files
+
+
+def finding_key(finding):
+    # the same plugin on the same port is one finding, whichever scanner saw it
+    return (finding.plugin_id, finding.port, finding.protocol)
+
+
+# What to do with a host that turns up more than once (several scanners,
+# or the same host listed twice in one file)
+HOST_MERGE_POLICIES = ("merge", "first", "last")
+
+
+def normalize_mac(mac):
+    # the mac-address tag can list several interfaces, one per line
+    if not mac:
+        return None
+    return "\n".join(sorted(m.strip().lower() for m in mac.split() if m.strip()))
+
+
+def merge_hosts(host, other):
+    # host with the findings of both, the first host's details win and
+    # other fills in what it lacks (MAC, host properties)
+    seen = {finding_key(v) for v in host._vulns}
+    extra = []
+    for vuln in other._vulns:
+        key = finding_key(vuln)
+        if key not in seen:
+            seen.add(key)
+            extra.append(vuln)
+    if not extra:
+        # nothing new from other, keep the findings list (and its buckets)
+        combined = Host(host._hostname, host._vulns)
+        combined._buckets = host._buckets
+    else:
+        combined = Host(host._hostname, host._vulns + extra)
+    combined._host_ipaddress = host._host_ipaddress
+    combined._mac_address = host._mac_address or other._mac_address
+    combined._report_filepath = host._report_filepath
+    if host._properties is not None and other._properties is not None:
+        combined._properties = host._properties.merged(other._properties)
+    else:
+        combined._properties = host._properties or other._properties
+    if combined._properties is not None:
+        combined._start_report = combined._properties.start
+        combined._end_report = combined._properties.end
+    return combined
+
+
+def dedupe_hosts(hosts, policy="merge"):
+    """
+    De-duplicate hosts on (host-ip, hostname), also comparing MACs when
+    both sides have one: the same ip and name with a different MAC is a
+    different machine. Hosts keep the order they were first seen in.
+    policy is one of HOST_MERGE_POLICIES.
+    """
+    uniq = []
+    # (ip, name) -> indexes into uniq; almost always a single entry
+    index = {}
+    for host in hosts:
+        candidates = index.setdefault((host._host_ipaddress, host._hostname), [])
+        for i in candidates:
+            mac = uniq[i]._mac_address
+            if not mac or not host._mac_address or mac == host._mac_address:
+                if policy == "merge":
+                    uniq[i] = merge_hosts(uniq[i], host)
+                elif policy == "last":
+                    uniq[i] = host
+                break
+        else:
+            candidates.append(len(uniq))
+            uniq.append(host)
+    return uniq
+
+
+def merge_reports(reportList, policy="merge"):
+    """
+    Merge the Reports parsed from one or more .nessus files into one, with
+    each host listed once (see dedupe_hosts).
+    """
+    hosts = dedupe_hosts(itertools.chain.from_iterable(
+        r.hosts for r in reportList), policy)
+    if len(reportList) == 1 and len(hosts) == reportList[0].host_count():
+        return reportList[0]
+    reportClass = Report()
+    for host in hosts:
+        reportClass.add_host(host)
+    return reportClass
+
+
+def get_all_reports(nessusFiles, cache_dir=None, jobs=1, policy="merge", item_filter=None):
+    # Parse each file in its own process, then merge them into one Report
+    workers = min(jobs, len(nessusFiles))
+    if workers <= 1:
+        reportList = [get_reports(f, cache_dir, item_filter) for f in nessusFiles]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            reportList = list(pool.map(get_reports, nessusFiles,
+                                       itertools.repeat(cache_dir),
+                                       itertools.repeat(item_filter)))
+    return merge_reports(reportList, policy)
 
 
 def get_list_of_totalFindings_object(reports):
-    total_C = []
-    total_H = []
-    total_M = []
-    total_L = []
-    total_I = []
-
-# Need to look at this.
-    for report in reports.hosts:
-        if report._critical_count:
-            total_C.append(report)
-        if report._high_count:
-            total_H.append(report)
-        if report._high_count:
-            total_M.append(report)
-        if report._low_count:
-            total_L.append(report)
-        if report._info_count:
-            total_I.append(report)
-
-    reports_out = {
-        "critical": total_C,
-        "high": total_H,
-        "medium": total_M,
-        "low": total_L,
-        "info": total_I,
-    }
-    return reports_out
+    # hosts with at least one finding of each severity
+    hostCounts = reports.table.host_severity_counts()
+    return {name.lower(): [reports.hosts[i] for i in np.flatnonzero(hostCounts[:, rank])]
+            for rank, name in enumerate(SEVERITIES)}
 
 
 def getall_findingTotals(reports):
-    total_C = 0
-    total_H = 0
-    total_M = 0
-    total_L = 0
-    total_I = 0
-
-    for report in reports.hosts:
-        total_C += report._critical_count
-        total_H += report._high_count
-        total_M += report._medium_count
-        total_L += report._low_count
-        total_I += report._info_count
-
-    counts = {
-        "critical": total_C,
-        "high": total_H,
-        "medium": total_M,
-        "low": total_L,
-        "info": total_I,
-    }
-    return counts
-
-# TODO : REWRITE WITH REPORTS NOT VULNS!!!
+    totals = reports.table.severity_totals()
+    return {name.lower(): int(totals[rank]) for rank, name in enumerate(SEVERITIES)}
 
 
-def uniq_hosts_from_report(reports):
-    uniq_hosts = []
-    for rep in reports.hosts:
-        # print(rep)
-        if rep._host_ipaddress not in uniq_hosts or rep._hostname not in uniq_hosts:
-            #print(f"Added: {rep._hostname}, IP: {rep._host_ipaddress}")
-            uniq_hosts.append(rep)
-    return uniq_hosts
+def uniq_hosts_from_report(reports, policy="first"):
+    return dedupe_hosts(reports.hosts, policy)
 
 
 def loop_hostsTester(reports):
-
-    uniq_hosts = []
-    for rep in reports.hosts:
-        # print(rep)
-        if rep._host_ipaddress not in uniq_hosts or rep._hostname not in uniq_hosts:
-            #print(f"Added: {rep._hostname}, IP: {rep._host_ipaddress}")
-            uniq_hosts.append(rep)
-    return uniq_hosts
+    return uniq_hosts_from_report(reports)
 
 
 def build_table_items(reports, column_length=3):
-    # for i in range(0, len(list1), 6):
-    #     print(list1[i:i+6])
-    #vulnList = sort_vlun_list(report)
-    #allCounts = getall_findingTotals(reports)
-    #listAll = get_list_of_totalFindings_object(reports)
     uniq_hosts = uniq_hosts_from_report(reports)
-    # a
-    #listAll = get_list_of_totalFindings_object(reports)
-    total = 0
-    allTds = []
+    # Hosts are coloured by their most severe finding, most severe first,
+    # then ordered by page path within each colour
+    ranked = []
     for rep in uniq_hosts:
-        #vulnList = sort_vlun_list(rep)
         rep.print_vuln_stats()
-        total += rep._total_count
-        # print(vulnList)
-        # if rep == "info":
-        #     if reports[rep] == 0:
-        #         #vulnsByhost[cat] = "0"
-        #         TD_ROW = f"<td class=\"infobg\"><a href=\"{ item._report_filepath}\">{ item._hostname}</a></td>"
-        #         allTds.append(TD_ROW)
-        #         continue
-        if rep._critical_count > 0:
-            TD_ROW = f"<td class=\"criticalbg\"><a href=\"{rep._report_filepath}\">{rep._hostname}</a></td>"
-            allTds.append(TD_ROW)
-            print(f"Classed: Critical - {rep._hostname}")
-            continue
-        if rep._high_count > 0 and rep._critical_count <= 0:
-            TD_ROW = f"<td class=\"highbg\"><a href=\"{rep._report_filepath}\">{rep._hostname}</a></td>"
-            allTds.append(TD_ROW)
-            print(f"Classed: High - {rep._hostname}")
-            continue
-        if rep._medium_count > 0 and rep._critical_count <= 0 and rep._high_count <= 0:
-            TD_ROW = f"<td class=\"mediumbg\"><a href=\"{rep._report_filepath}\">{rep._hostname}</a></td>"
-            allTds.append(TD_ROW)
-            print(f"Classed: Medium - {rep._hostname}")
-            continue
-        if rep._low_count > 0 and rep._critical_count <= 0 and rep._high_count <= 0 and rep._medium_count <= 0:
-            TD_ROW = f"<td class=\"lowbg\"><a href=\"{rep._report_filepath}\">{rep._hostname}</a></td>"
-            allTds.append(TD_ROW)
-            print(f"Classed: Low - {rep._hostname}")
+        rank = rep.worst_severity()
+        if rank is None:
             continue
-        if rep._info_count > 0 and rep._critical_count <= 0 and rep._high_count <= 0 and rep._medium_count <= 0 and rep._low_count <= 0:
-            TD_ROW = f"<td class=\"infobg\"><a href=\"{rep._report_filepath}\">{rep._hostname}</a></td>"
-            print(f"Classed: Info - {rep._hostname}")
-            allTds.append(TD_ROW)
-        # for vuln in vulnList:
-        # print(vuln._hostname)
-        # risk_factor = r._vulns[i]['risk_factor']
-        # # make class criticalbg, highbg, mediumbg, lowbg, infogb
-        # if risk_factor is "Critical":
-        #     allTds.append(
-        #         f"<td class=\"criticalbg\"><a href=\"{r._report_filepath}\">{r._hostname}</a></td>")
-        # if risk_factor is "High":
-        #     allTds.append(
-        #         f"<td class=\"highbg\"><a href=\"{r._report_filepath}\">{r._hostname}</a></td>")
-        # if risk_factor is "Medium":
-        #     allTds.append(
-        #         f"<td class=\"mediumbg\"><a href=\"{r._report_filepath}\">{r._hostname}</a></td>")
-        # if risk_factor is "Low":
-        #     allTds.append(
-        #         f"<td class=\"lowbg\"><a href=\"{r._report_filepath}\">{r._hostname}</a></td>")
-        # if risk_factor is "Info":
-        #     allTds.append(
-        #         f"<td class=\"infobg\"><a href=\"{r._report_filepath}\">{r._hostname}</a></td>")
-
-        # six per row
-        # TD_ROW = f"<td class=\"lowbg\"><a href=\"{rep._report_filepath}\">{rep._hostname}</a></td>"
-        # allTds.append(TD_ROW)
-        # allTds.sort()
-        #print(f"total: {total}")
-    # add a check for dupe items
-    allTds.sort()
-    sortedList = []
-
-    lastIndexofCritical = [x for x in allTds if "criticalbg" in x]
-    lastIndexofHigh = [x for x in allTds if "highbg" in x]
-    lastIndexofMedium = [x for x in allTds if "mediumbg" in x]
-    lastIndexofLow = [x for x in allTds if "lowbg" in x]
-    lastIndexofInfo = [x for x in allTds if "infobg" in x]
-
-    sortedList.extend(lastIndexofCritical)
-    sortedList.extend(lastIndexofHigh)
-    sortedList.extend(lastIndexofMedium)
-    sortedList.extend(lastIndexofLow)
-    sortedList.extend(lastIndexofInfo)
-
-    # print(sortedList)
-    allTd_byLength = []
-    sortedList = list(filter(None, sortedList))
-    for i in range(0, len(sortedList), column_length):
+        print(f"Classed: {SEVERITIES[rank]} - {rep._hostname}")
+        ranked.append((rank, str(rep._report_filepath), rep._hostname, rep))
+    ranked.sort(key=lambda x: x[:3])
+
+    sortedList = [
+        f"<td class=\"{SEVERITIES[rank].lower()}bg\"><a href=\"{rep._report_filepath}\">{escape_html(rep._hostname)}</a></td>"
+        for rank, _, _, rep in ranked]
 
-        hns = ''.join(sortedList[i:i+column_length])
-        allTd_byLength.append(hns)
     final = []
-    for td in allTd_byLength:
-        final.append(f"<tr>{td}</tr>")
+    for i in range(0, len(sortedList), column_length):
+        final.append(f"<tr>{''.join(sortedList[i:i+column_length])}</tr>")
     returnString = ''.join(final)
     print(returnString)
     return returnString
 
 
-def build_dashboard_page(reports, template_path, sorted_vulns_by_host, argparse_options):
+def build_dashboard_page(reports, template_path, output_path, sorted_vulns_by_host, argparse_options):
 
     # Swap values in index.html page (customername, timereportGenerated, Findings, piechart, hosts...)
-    c_time = os.path.getctime(argparse_options["input_file"])
+    inputFiles = argparse_options["input_file"]
+    if isinstance(inputFiles, str):
+        inputFiles = [inputFiles]
+    c_time = max(os.path.getctime(f) for f in inputFiles)
     dt_c = datetime.fromtimestamp(c_time).strftime("%d/%m/%Y, %H:%M:%S")
     creationTime = dt_c
-    # print(dt_c)
-    replace_value_in_file(template_path, "|||TIMECREATED|||", creationTime)
-    replace_value_in_file(template_path, "|||COMPANYNAME|||",
-                          argparse_options['customerName'])
     allCounts = getall_findingTotals(reports)
 
+    with open(template_path, 'r') as template:
+        contents = template.read()
+
     showInfos = False
     if not showInfos:
         sorted_vulns_by_host['info'] = 0
         replaceVar = '<li style="font-size: 14px;">Total Info:&nbsp;<span class="spanFindings" style="font-size: 14px;">|||TOTALINFORMATION|||</span></li>'
-        replace_value_in_file(
-            template_path, replaceVar, "")
-    else:
-        replace_value_in_file(
-            template_path, "|||TOTALINFORMATION|||", allCounts['info'])
+        contents = contents.replace(replaceVar, "")
 
     TOTAL = (allCounts['critical'] + allCounts['high'] +
              allCounts['medium'] + allCounts['low'] + allCounts['info'])
     # TODO: inplement check here for info showing or not.
-    hostnames_table = build_table_items(reports)
-    #allCounts = getall_findingTotals(hostnames_table)
-    replace_value_in_file(
-        template_path, "|||TOTALCRITICAL|||", allCounts['critical'])
-    replace_value_in_file(template_path, "|||TOTALHIGH|||",
-                          allCounts['high'])
-    replace_value_in_file(
-        template_path, "|||TOTALMEDIUM|||", allCounts['medium'])
-    replace_value_in_file(template_path, "|||TOTALLOW|||",
-                          allCounts['low'])
+    values = {
+        "TIMECREATED": creationTime,
+        "COMPANYNAME": argparse_options['customerName'],
+        "TOTALINFORMATION": allCounts['info'],
+        "TOTALCRITICAL": allCounts['critical'],
+        "TOTALHIGH": allCounts['high'],
+        "TOTALMEDIUM": allCounts['medium'],
+        "TOTALLOW": allCounts['low'],
+        "TOTALFINDINGS": TOTAL,
+        # build table for index page
+        "TABLEREPLACE": build_table_items(reports),
+        "PIE-CHART": draw_pieChart(allCounts, argparse_options.get('chart_backend', DEFAULT_CHART_BACKEND)),
+    }
+    with open(output_path, 'w') as out:
+        Template(contents).render_to(out, values)
+
+
+# Severities listed on the all vulns page, in page order. Info is left out
+# to keep the size of the report down.
+ALLVULNS_SEVERITIES = ("Critical", "High", "Medium", "Low")
+
+
+class ByteCountingWriter(object):
+    """
+    Writes text to a binary file as utf-8 and keeps count of the bytes
+    written, so sections of the page can be located again by offset.
+    """
+
+    def __init__(self, fh):
+        self._fh = fh
+        self.offset = 0
 
-    replace_value_in_file(template_path, "|||TOTALFINDINGS|||", TOTAL)
+    def write(self, text):
+        self.write_bytes(text.encode('utf-8'))
 
-    # build table for index page
-    #hostnames_table = build_table_items(reports)
+    def write_bytes(self, data):
+        self._fh.write(data)
+        self.offset += len(data)
 
-    # print(hostnames_table)
-    replace_value_in_file(template_path, "|||TABLEREPLACE|||", hostnames_table)
 
-    imageText = draw_pieChart(allCounts)
-    replace_value_in_file(template_path, "|||PIE-CHART|||", imageText)
+def iter_host_block(report, rating, lazy=False, start=0, end=None):
+    """
+    Accordions for one host's findings of one severity (optionally just
+    the [start:end] slice of them), as listed on the all vulns page.
+    """
+    stem = host_page_stem(report)
+    rank = SEVERITY_RANK[rating]
+    buckets = report.severity_buckets()
+    # the host's shard holds its findings in severity order
+    offset = sum(len(b) for b in buckets[:rank])
+    bucket = buckets[rank]
+    for idCount in range(start, len(bucket) if end is None else end):
+        vuln = bucket[idCount]
+        # ids are scoped to the host so blocks copied by --update never clash
+        id = f"{accordion_id_prefix(stem)}-{rating.lower()}-{idCount}"
+        if lazy:
+            yield build_AccordionItem(vuln, "", id, shard=(stem, offset + idCount))
+        else:
+            synopsisCode = get_vuln_synopsis(vuln, report._host_ipaddress)
+            yield build_AccordionItem(vuln, synopsisCode, id)
+
+
+def iter_allvulns_items(reports, writer, sections, previous=None, oldPage=None, lazy=False):
+    """
+    Yield the all vulns accordions one at a time, a severity bucket at a
+    time (criticals of every host, then highs, ...), so the page can be
+    streamed to disk without holding every finding's html in memory.
 
+    Each host's block within a bucket is recorded in sections as a
+    [start, end] byte range of the page. When updating a report, blocks of
+    hosts whose findings haven't changed are copied from the old page
+    instead of being rendered again.
 
-def build_allvulns_page(reports, template_path, options):
+    With lazy set (--lazy-bodies) only the accordion headers are written,
+    pointing at the bodies in the host shards written by create_vulnbyHost.
+    """
+    for rating in ALLVULNS_SEVERITIES:
+        for report in reports.hosts:
+            stem = host_page_stem(report)
+            start = writer.offset
+            old = previous['hosts'].get(stem) if previous else None
+            if old and old['digest'] == host_digest(report):
+                oldRange = previous['allvulns'].get(stem, {}).get(rating)
+                if oldRange:
+                    oldPage.seek(oldRange[0])
+                    writer.write_bytes(oldPage.read(oldRange[1] - oldRange[0]))
+            else:
+                yield from iter_host_block(report, rating, lazy)
+            # the consumer writes each yielded chunk before resuming us, so the
+            # writer offset now includes this host's whole block
+            if writer.offset > start:
+                sections.setdefault(stem, {})[rating] = [start, writer.offset]
+
+
+def iter_allvulns_grouped(reports):
+    """
+    --group-by-plugin: one accordion per plugin and severity, with the
+    plugin's text rendered once and a table of the hosts/ports it fired on,
+    instead of one full accordion per (host, plugin) pair.
+    """
+    for rating in ALLVULNS_SEVERITIES:
+        rank = SEVERITY_RANK[rating]
+        # plugin_id -> [(host, finding)], plugins in the order first seen
+        byPlugin = {}
+        for report in reports.hosts:
+            for vuln in report.severity_buckets()[rank]:
+                byPlugin.setdefault(vuln.plugin_id, []).append((report, vuln))
+        for pluginId, affected in byPlugin.items():
+            vuln = affected[0][1]
+            hostCount = len({id(host) for host, v in affected})
+            title = f"{vuln.plugin_name} ({hostCount} host{'' if hostCount == 1 else 's'})"
+            yield build_AccordionItem(vuln, get_plugin_group_synopsis(vuln, affected),
+                                      f"{rating.lower()}-plugin-{pluginId}", title)
+
+
+def build_allvulns_index(reports, page_size):
+    """
+    Split each severity's findings into pages of page_size. Every page is a
+    list of (host index, start, end) slices of the hosts' severity buckets,
+    plus the counts and plugin names shown in the navigation index, so any
+    page can be rendered on its own.
+    """
+    pages = []
+
+    def close_page(rating, slices, count):
+        first = reports.hosts[slices[0][0]].severity_buckets()[SEVERITY_RANK[rating]][slices[0][1]]
+        last = reports.hosts[slices[-1][0]].severity_buckets()[SEVERITY_RANK[rating]][slices[-1][2] - 1]
+        number = sum(1 for p in pages if p['rating'] == rating) + 1
+        pages.append({'rating': rating, 'number': number, 'slices': slices, 'count': count,
+                      'first': first.plugin_name, 'last': last.plugin_name,
+                      'file': f"{rating.lower()}_{number}.html"})
+
+    for rating in ALLVULNS_SEVERITIES:
+        rank = SEVERITY_RANK[rating]
+        slices, count = [], 0
+        for hostIndex, report in enumerate(reports.hosts):
+            bucketSize = len(report.severity_buckets()[rank])
+            start = 0
+            while start < bucketSize:
+                end = min(bucketSize, start + page_size - count)
+                slices.append((hostIndex, start, end))
+                count += end - start
+                start = end
+                if count == page_size:
+                    close_page(rating, slices, count)
+                    slices, count = [], 0
+        if slices:
+            close_page(rating, slices, count)
+    return pages
+
+
+def build_allvulns_nav(pages):
+    rows = "".join(
+        f"<tr><td><span class=\"vulnlabel {p['rating'].lower()}\">{p['rating'].upper()}</span></td>"
+        f"<td><a href=\"{p['file']}\">Page {p['number']}</a></td><td>{p['count']}</td>"
+        f"<td>{escape_shared(p['first'])}</td><td>{escape_shared(p['last'])}</td></tr>"
+        for p in pages)
+    return ("<table class=\"table\"><tr><th>Severity</th><th>Page</th><th>Findings</th>"
+            f"<th>First</th><th>Last</th></tr>{rows}</table>")
+
+
+def build_allvulns_page_links(pages, index, indexFile):
+    page = pages[index]
+    links = [f"<a href=\"{indexFile}\">Index</a>"]
+    if index > 0:
+        links.append(f"<a href=\"{pages[index - 1]['file']}\">Previous</a>")
+    sameRating = sum(1 for p in pages if p['rating'] == page['rating'])
+    links.append(f"{page['rating']} page {page['number']} of {sameRating}")
+    if index + 1 < len(pages):
+        links.append(f"<a href=\"{pages[index + 1]['file']}\">Next</a>")
+    return f"<p>{' | '.join(links)}</p>"
+
+
+def render_allvulns_subpage(reports, template_path, directory, pages, index, values, lazy, indexFile):
+    page = pages[index]
+    items = (block for hostIndex, start, end in page['slices']
+             for block in iter_host_block(reports.hosts[hostIndex], page['rating'], lazy, start, end))
+    links = build_allvulns_page_links(pages, index, indexFile)
+    with open(os.path.join(directory, page['file']), 'w', encoding='utf-8') as out:
+        load_template(template_path).render_to(out, dict(values, REPLACEME=itertools.chain(
+            [links], items, [links, LAZY_LOADER_SCRIPT] if lazy else [links])))
+
+
+def _init_allvulns_worker(*args):
+    _worker_state['allvulns'] = args
+
+
+def _render_allvulns_worker(index):
+    reports, template_path, directory, pages, values, lazy, indexFile = _worker_state['allvulns']
+    render_allvulns_subpage(reports, template_path, directory,
+                            pages, index, values, lazy, indexFile)
+
+
+def build_paginated_allvulns(reports, template_path, output_path, options, values, lazy):
+    """
+    --page-size: output_path becomes a navigation index and the findings go
+    to <severity>_<n>.html pages next to it. Pages are independent of each
+    other, so with --jobs they are rendered in parallel.
+    """
+    directory = os.path.dirname(output_path)
+    pages = build_allvulns_index(reports, options['page_size'])
+    # drop pages left over from an earlier, longer, run
+    for name in os.listdir(directory):
+        if re.fullmatch(r"(critical|high|medium|low)_\d+\.html", name):
+            os.remove(os.path.join(directory, name))
+
+    indexFile = os.path.basename(output_path)
+    jobs = options.get('jobs') or 1
+    if jobs <= 1 or len(pages) <= 1:
+        for index in range(len(pages)):
+            render_allvulns_subpage(reports, template_path, directory,
+                                    pages, index, values, lazy, indexFile)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_allvulns_worker,
+                                 initargs=(reports, template_path, directory, pages, values, lazy, indexFile)) as pool:
+            list(pool.map(_render_allvulns_worker, range(len(pages))))
+
+    with open(output_path, 'w', encoding='utf-8') as out:
+        load_template(template_path).render_to(out, dict(values, REPLACEME=build_allvulns_nav(pages)))
+
+
+def build_allvulns_page(reports, template_path, output_path, options, previous=None):
     allCounts = getall_findingTotals(reports)
     TOTAL = (allCounts['critical'] + allCounts['high'] +
              allCounts['medium'] + allCounts['low'] + allCounts['info'])
-    #allCounts = getall_findingTotals(hostnames_table)
-    replace_value_in_file(
-        template_path, "|||TOTALCRITICAL|||", allCounts['critical'])
-    replace_value_in_file(template_path, "|||TOTALHIGH|||",
-                          allCounts['high'])
-    replace_value_in_file(
-        template_path, "|||TOTALMEDIUM|||", allCounts['medium'])
-    replace_value_in_file(template_path, "|||TOTALLOW|||",
-                          allCounts['low'])
-    replace_value_in_file(
-        template_path, "|||TOTALINFORMATION|||", allCounts['info'])
-
-    #replace_value_in_file(template_path, "assets/", "../assets/")
-
-    imageText = draw_pieChart(allCounts)
-    replace_value_in_file(template_path, "|||PIE-CHART|||", imageText)
-
-    replace_value_in_file(template_path, "|||TOTALFINDINGS|||", TOTAL)
-    htmlParts = []
-    critical = []
-    high = []
-    medium = []
-    low = []
-    info = []
-    idCount = 0
-    for report in reports.hosts:
-        vulnList = sort_vlun_list(report)
-        for vuln in vulnList:
-            if not vuln:
-                continue
+    sections = {}
+    grouped = options.get('group_by_plugin')
+    paged = options.get('page_size') and not grouped
+    # grouped accordions aren't per host, so their bodies always stay inline
+    lazy = options.get('lazy_bodies') and not grouped
+    # only the single, per host, page can be updated in place
+    oldPage = open(output_path, 'rb') if previous and not (grouped or paged) and os.path.exists(
+        output_path) else None
+    if oldPage is None:
+        previous = None
+    values = {
+        "TOTALCRITICAL": allCounts['critical'],
+        "TOTALHIGH": allCounts['high'],
+        "TOTALMEDIUM": allCounts['medium'],
+        "TOTALLOW": allCounts['low'],
+        "TOTALINFORMATION": allCounts['info'],
+        "TOTALFINDINGS": TOTAL,
+        "PIE-CHART": draw_pieChart(allCounts, options.get('chart_backend', DEFAULT_CHART_BACKEND)),
+    }
+    if paged:
+        build_paginated_allvulns(reports, template_path, output_path, options, values, lazy)
+        return sections
+
+    tmpPath = f"{output_path}.tmp"
+    try:
+        with open(tmpPath, 'wb') as out:
+            writer = ByteCountingWriter(out)
+            load_template(template_path).render_to(writer, dict(values, **{
+                # findings are generated while the page is being written
+                "REPLACEME": itertools.chain(
+                    iter_allvulns_grouped(reports) if grouped else
+                    iter_allvulns_items(reports, writer, sections, previous, oldPage, lazy),
+                    [LAZY_LOADER_SCRIPT] if lazy else []),
+            }))
+    finally:
+        if oldPage:
+            oldPage.close()
+    os.replace(tmpPath, output_path)
+    return sections
+
+
+# Client side search: assets/search.html plus an inverted index over
+# plugin name and id, CVE, port and service (per finding) and hostname and
+# ip (per host). The index is a .js file for the same reason as the shards:
+# it has to load from a report opened straight off disk.
+SEARCH_PAGE = "search.html"
+SEARCH_INDEX_JS = "search_index.js"
+SEARCH_TOKEN_RE = re.compile(r"[a-z0-9]+")
+SEARCH_PAGE_SOURCE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="utf-8">
+    <title>Search Findings</title>
+    <link rel="stylesheet" href="bootstrap/css/bootstrap.min.css">
+    <link rel="stylesheet" href="css/defencelogic.compiled.css">
+</head>
+<body>
+    <div class="container" style="margin-top: 20px;">
+        <p><a href="../index.html">Dashboard</a></p>
+        <input id="q" class="form-control" type="search" placeholder="Plugin, CVE, host, IP, port or service" autofocus>
+        <p id="status"></p>
+        <table class="table"><thead><tr><th>Severity</th><th>Host</th><th>Port</th><th>Finding</th></tr></thead>
+        <tbody id="results"></tbody></table>
+    </div>
+    <script src="search/search_index.js"></script>
+    <script>
+    (function () {
+        var idx = PYNESS_SEARCH, LIMIT = 500;
+        function esc(s) {
+            return String(s).replace(/[&<>"']/g, function (c) { return "&#" + c.charCodeAt(0) + ";"; });
+        }
+        var keys = Object.keys(idx.tokens).concat(Object.keys(idx.host_tokens)).sort();
+
+        function docsFor(token, prefix) {
+            // every finding matching token (or, for the last word typed, any
+            // token starting with it), from both finding and host postings
+            var out = new Set();
+            var words = [token];
+            if (prefix) {
+                words = [];
+                var lo = 0, hi = keys.length;
+                while (lo < hi) { var mid = (lo + hi) >> 1; if (keys[mid] < token) lo = mid + 1; else hi = mid; }
+                for (var i = lo; i < keys.length && keys[i].lastIndexOf(token, 0) === 0; i++) words.push(keys[i]);
+            }
+            words.forEach(function (w) {
+                (idx.tokens[w] || []).forEach(function (d) { out.add(d); });
+                (idx.host_tokens[w] || []).forEach(function (h) {
+                    for (var d = idx.hosts[h][3]; d < idx.hosts[h][4]; d++) out.add(d);
+                });
+            });
+            return out;
+        }
+
+        function search(text) {
+            var tokens = text.toLowerCase().match(/[a-z0-9]+/g) || [];
+            if (!tokens.length) return [];
+            var result = null;
+            tokens.forEach(function (t, i) {
+                var docs = docsFor(t, i === tokens.length - 1);
+                result = result === null ? docs : new Set([...result].filter(function (d) { return docs.has(d); }));
+            });
+            return Array.from(result).sort(function (a, b) { return a - b; });
+        }
+
+        var q = document.getElementById("q");
+        q.addEventListener("input", function () {
+            var found = search(q.value), rows = [];
+            found.slice(0, LIMIT).forEach(function (d) {
+                var host = idx.hosts[idx.doc_host[d]], sev = idx.severities[idx.doc_severity[d]];
+                rows.push("<tr><td><span class=\\"vulnlabel " + sev.toLowerCase() + "\\">" + sev.toUpperCase() +
+                    "</span></td><td><a href=\\"" + esc(host[2]) + "\\">" + esc(host[0]) + "</a> (" + esc(host[1]) + ")</td><td>" +
+                    idx.doc_port[d] + "/" + esc(idx.services[idx.doc_service[d]]) + "</td><td>" +
+                    esc(idx.plugins[idx.doc_plugin[d]]) + "</td></tr>");
+            });
+            document.getElementById("results").innerHTML = rows.join("");
+            document.getElementById("status").textContent = found.length > LIMIT ?
+                "Showing " + LIMIT + " of " + found.length + " findings" : found.length + " findings";
+        });
+    })();
+    </script>
+</body>
+</html>
+"""
+
+
+def search_tokens(*values):
+    tokens = set()
+    for value in values:
+        if value:
+            tokens.update(SEARCH_TOKEN_RE.findall(str(value).lower()))
+    return tokens
+
+
+def build_search_index(reports, assets_directory):
+    """
+    One pass over every finding: each becomes a document (its columns are
+    stored as parallel arrays) and its tokens are added to the posting
+    lists. Host tokens point at hosts, whose findings are a contiguous
+    [first, end) range of documents, so a hostname isn't repeated for every
+    finding on the host.
+    """
+    hosts, plugins, services = [], {}, {}
+    docHost, docPlugin, docSeverity, docPort, docService = (
+        array('i'), array('i'), array('b'), array('i'), array('i'))
+    tokens, hostTokens = {}, {}
+    for hostIndex, report in enumerate(reports.hosts):
+        first = len(docHost)
+        for vuln in report._vulns:
+            docId = len(docHost)
+            docHost.append(hostIndex)
+            docPlugin.append(plugins.setdefault(vuln.plugin_name, len(plugins)))
+            docSeverity.append(SEVERITY_RANK.get(vuln.risk_factor, len(SEVERITIES) - 1))
+            docPort.append(int(vuln.port or 0))
+            docService.append(services.setdefault(f"{vuln.protocol}/{vuln.svc_name}", len(services)))
+            for token in search_tokens(vuln.plugin_name, vuln.plugin_id, vuln.port,
+                                       vuln.svc_name, *vuln.cves):
+                tokens.setdefault(token, array('i')).append(docId)
+        pagePath = f"../{SAVE_VULNSBYHOST_FOLDER}/{host_page_stem(report)}.html"
+        hosts.append([report._hostname, report._host_ipaddress, pagePath, first, len(docHost)])
+        for token in search_tokens(report._hostname, report._host_ipaddress):
+            hostTokens.setdefault(token, array('i')).append(hostIndex)
+
+    searchDir = os.path.join(assets_directory, "search")
+    os.makedirs(searchDir, exist_ok=True)
+    compact = dict(separators=(',', ':'))
+    with open(os.path.join(searchDir, SEARCH_INDEX_JS), 'w', encoding='utf-8') as f:
+        f.write("var PYNESS_SEARCH={")
+        for name, value in (("severities", SEVERITIES), ("hosts", hosts),
+                            ("plugins", list(plugins)), ("services", list(services)),
+                            ("doc_host", docHost), ("doc_plugin", docPlugin),
+                            ("doc_severity", docSeverity), ("doc_port", docPort),
+                            ("doc_service", docService)):
+            f.write(f'"{name}":')
+            json.dump(value.tolist() if isinstance(value, array) else value, f, **compact)
+            f.write(",")
+        for name, postings in (("tokens", tokens), ("host_tokens", hostTokens)):
+            f.write(f'"{name}":{{')
+            f.write(",".join(f"{json.dumps(t)}:{json.dumps(postings[t].tolist(), **compact)}"
+                             for t in sorted(postings)))
+            f.write("}" if name == "host_tokens" else "},")
+        f.write("};\n")
+    with open(os.path.join(assets_directory, SEARCH_PAGE), 'w') as f:
+        f.write(SEARCH_PAGE_SOURCE)
+
+
+# Everything --update needs to know about the report already on disk
+REPORT_MANIFEST = "report_manifest.json"
+# Bump when the generated html changes so --update re-renders everything
+RENDER_VERSION = 4
+
+
+def host_digest(report):
+    # digest of everything about a host that ends up in its html
+    if report._findings_digest is None:
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{report._hostname}\0{report._host_ipaddress}".encode())
+        for vuln in report._vulns:
+            for name in Finding.__slots__:
+                digest.update(b"\0")
+                digest.update(str(getattr(vuln, name)).encode())
+        report._findings_digest = digest.hexdigest()
+    return report._findings_digest
+
+
+def render_signature(options, templates):
+    # anything that changes every page at once forces a full re-render
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{RENDER_VERSION}|{options['customerName']}|{options.get('chart_backend')}|"
+                  f"{options.get('group_by_plugin')}|{options.get('lazy_bodies')}|{options.get('page_size')}".encode())
+    for path in templates:
+        digest.update(file_digest(path).encode())
+    return digest.hexdigest()
+
+
+def load_report_manifest(report_directory, signature):
+    try:
+        with open(os.path.join(report_directory, REPORT_MANIFEST), 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('signature') != signature:
+        return None
+    return manifest
+
+
+def save_report_manifest(report_directory, signature, reports, allvulnsSections):
+    manifest = {
+        'signature': signature,
+        'hosts': {host_page_stem(r): {'digest': host_digest(r), 'path': r._report_filepath}
+                  for r in reports.hosts},
+        'allvulns': allvulnsSections,
+    }
+    with open(os.path.join(report_directory, REPORT_MANIFEST), 'w') as f:
+        json.dump(manifest, f)
 
-            _host_ipaddress = report._host_ipaddress
-            synopsisCode = get_vuln_synopsis(vuln, _host_ipaddress)
-            htmlPart = build_AccordionItem(vuln, synopsisCode, idCount)
-            idCount += 1
-            if vuln['risk_factor'] == "Critical":
-                critical.append(htmlPart)
-                continue
-            if vuln['risk_factor'] == "High":
-                high.append(htmlPart)
-                continue
-            if vuln['risk_factor'] == "Medium":
-                medium.append(htmlPart)
-                continue
-            if vuln['risk_factor'] == "Low":
-                low.append(htmlPart)
-                continue
-            if vuln['risk_factor'] == "Info":
-                # Hide infro from report
-               # info.append(htmlPart)
-                continue
-            idCount += 1
-    htmlParts.extend(critical)
-    htmlParts.extend(high)
-    htmlParts.extend(medium)
-    htmlParts.extend(low)
-    htmlParts.extend(info)
 
-    # print(vuln)
-    replace_value_in_file(
-        template_path, "|||REPLACEME||||", "".join(htmlParts))
-    pass
+def print_run_summary(reports, started):
+    allCounts = getall_findingTotals(reports)
+    hits, misses = chart_cache_stats()
+    lookups = hits + misses
+    hitRate = (hits / lookups * 100) if lookups else 0
+    print()
+    print(f"Hosts: {reports.host_count()}, Findings: {sum(allCounts.values())}")
+    for pluginId, pluginName, count in reports.table.top_plugins(5, SEVERITY_RANK["Low"]):
+        print(f"  {count:>8}  {pluginId}  {pluginName}")
+    print(f"Pie charts: {lookups} requested, {misses} drawn, "
+          f"cache hit rate {hitRate:.1f}%")
+    print(f"Finished in {time.time() - started:.2f}s")
 
 
 def main():
+    started = time.time()
     par = argparse.ArgumentParser()
-    par.add_argument("-i", "--input-file",
-                     help="a .nessus report file only", required=True)
+    par.add_argument("-i", "--input-file", nargs="+",
+                     help="one or more .nessus report files or globs, hosts seen in several files are merged", required=True)
     par.add_argument("-c", "--customerName",
                      help="Enter a customer name for the report", default="", required=False)
+    par.add_argument("-j", "--jobs", type=int, default=1,
+                     help="Number of processes used to parse input files and render host pages (default: 1)")
+    par.add_argument("--merge-policy", choices=HOST_MERGE_POLICIES, default="merge",
+                     help="How duplicate hosts are combined: union their findings, or keep the first/last copy (default: %(default)s)")
+    par.add_argument("--chart-backend", choices=("cairo", "native"), default=DEFAULT_CHART_BACKEND,
+                     help="Draw the pie charts with pycairo or as plain svg paths (default: %(default)s)")
+    par.add_argument("-u", "--update", metavar="REPORT_DIR", default=None,
+                     help="Update an existing report folder, only re-rendering hosts whose findings changed")
+    par.add_argument("-g", "--group-by-plugin", action="store_true",
+                     help="List each plugin once on the all vulns page, with a table of the hosts it affects")
+    par.add_argument("--page-size", type=int, default=0, metavar="N",
+                     help="Split the all vulns page into pages of N findings per severity, with an index page (default: one page)")
+    par.add_argument("--lazy-bodies", action="store_true",
+                     help="Only write accordion headers into the pages, finding details are loaded per host when opened")
+    par.add_argument("--min-severity", choices=SEVERITIES, default=None,
+                     help="Drop findings below this severity while parsing (default: keep all)")
+    par.add_argument("--exclude-plugin", type=int, nargs="+", metavar="PLUGIN_ID",
+                     help="Drop findings from these plugin ids while parsing")
+    par.add_argument("--include-family", nargs="+", metavar="FAMILY",
+                     help="Only keep findings from these plugin families")
+    par.add_argument("--port", type=int, nargs="+",
+                     help="Only keep findings on these ports")
+    par.add_argument("--cache-dir", default=None,
+                     help="Cache parsed scans in this folder so re-runs on an unchanged scan skip the parse; "
+                          "it must only be writable by trusted users (default: no cache)")
     args = par.parse_args()
+    if args.chart_backend == "cairo" and not CAIRO_AVAILABLE:
+        par.error("pycairo is not installed, use --chart-backend native")
+    if args.update and not os.path.isdir(args.update):
+        par.error(f"report folder not found: {args.update}")
+    if args.page_size < 0:
+        par.error("--page-size must be 0 (one page) or a positive number of findings")
     # Options (input_file | customerName)
     options = vars(args)
 
@@ -763,51 +1852,68 @@ def main():
 
     # set datetime string for filenames
     date = datetime.now().strftime("%d_%m_%Y-%I-%M-%S_%p")
-    currDir = os.path.dirname(__file__)
+    currDir = os.path.dirname(os.path.abspath(__file__))
     REPORT_DIR = f"report_{options['customerName']}_{date}"
     REPORT_DIR = slugify(REPORT_DIR)
-    REPORT_DIR = rf"{currDir}\{REPORT_DIR}"
-    ASSETS_DIR = rf"{REPORT_DIR}\assets"
-    INDEX_PAGE = rf"{REPORT_DIR}\index.html"
-    VULN_BY_HOST_TEMPLATE = rf"{currDir}\\files\template\vbh_template.html"
-    ALL_VULNS_TEMPLATE = rf"{currDir}\files\template\allvulns_template.html"
-    ALL_VULNS = rf"{REPORT_DIR}\allvulns\allvulns_template.html"
-
-    # 1. Parse File
-    reports = get_reports(options['input_file'])
+    REPORT_DIR = os.path.join(currDir, REPORT_DIR)
+    if options['update']:
+        REPORT_DIR = os.path.abspath(options['update'])
+    ASSETS_DIR = os.path.join(REPORT_DIR, "assets")
+    INDEX_PAGE = os.path.join(REPORT_DIR, "index.html")
+    TEMPLATE_DIR = os.path.join(currDir, "files", "template")
+    VULN_BY_HOST_TEMPLATE = os.path.join(TEMPLATE_DIR, "vbh_template.html")
+    ALL_VULNS_TEMPLATE = os.path.join(TEMPLATE_DIR, "allvulns_template.html")
+    ALL_VULNS = os.path.join(REPORT_DIR, "allvulns", "allvulns_template.html")
+
+    CACHE_DIR = options['cache_dir']
+
+    options['input_file'] = expand_input_files(options['input_file'])
+    if not options['input_file']:
+        par.error("no .nessus files matched --input-file")
+
+    # 1. Parse File(s)
+    reports = get_all_reports(
+        options['input_file'], CACHE_DIR, options['jobs'], options['merge_policy'],
+        ReportItemFilter.from_options(options))
     # 2. Check prequisits
     # Copy any assets over to the report folder
-    assetsDirOriginal = os.path.join(currDir, "files\\assets")
-    indexOriginal = os.path.join(currDir, "files\\index.html")
-    # Copy main page (index - home page) over to the report folder
-    # time.sleep(0.2)
-
-    # Need better folder and file management functions.
-
-    if not os.path.exists(INDEX_PAGE):
-        os.mkdir(os.path.dirname(INDEX_PAGE))
-
-    shutil.copyfile(indexOriginal, INDEX_PAGE)
-    shutil.copyfile(indexOriginal, INDEX_PAGE)
-    if os.path.exists(ASSETS_DIR):
-        shutil.rmtree(ASSETS_DIR)
-    shutil.copytree(
-        assetsDirOriginal, ASSETS_DIR)
+    assetsDirOriginal = os.path.join(currDir, "files", "assets")
+    indexOriginal = os.path.join(currDir, "files", "index.html")
+
+    os.makedirs(os.path.dirname(ALL_VULNS), exist_ok=True)
+    if not (options['update'] and os.path.exists(ASSETS_DIR)):
+        if os.path.exists(ASSETS_DIR):
+            shutil.rmtree(ASSETS_DIR)
+        shutil.copytree(
+            assetsDirOriginal, ASSETS_DIR)
+    if options['lazy_bodies']:
+        write_lazy_loader(ASSETS_DIR)
+
+    # --update: compare against what the existing report was rendered from
+    signature = render_signature(
+        options, (VULN_BY_HOST_TEMPLATE, ALL_VULNS_TEMPLATE, indexOriginal))
+    previous = load_report_manifest(
+        REPORT_DIR, signature) if options['update'] else None
+
     # Build VulnsByHost
-    create_vulnbyHost(reports, VULN_BY_HOST_TEMPLATE, REPORT_DIR, options)
+    create_vulnbyHost(reports, VULN_BY_HOST_TEMPLATE,
+                      REPORT_DIR, options, previous)
 
     # Build Dashboard
     # Remake how you loop the hosts and parseing data..... use the methond below for better results.
     allCounts = getall_findingTotals(reports)
     #dashboard_hosts = get_list_of_totalFindings_object(reports)
-    build_dashboard_page(reports, INDEX_PAGE, allCounts, options)
-    # print(dashboard_hosts)
+    build_dashboard_page(reports, indexOriginal, INDEX_PAGE, allCounts, options)
 
-    if not os.path.exists(ALL_VULNS):
-        os.mkdir(os.path.dirname(ALL_VULNS))
-    shutil.copyfile(ALL_VULNS_TEMPLATE, ALL_VULNS)
     # Build AllVulns
-    build_allvulns_page(reports, ALL_VULNS, options)
+    allvulnsSections = build_allvulns_page(
+        reports, ALL_VULNS_TEMPLATE, ALL_VULNS, options, previous)
+    save_report_manifest(REPORT_DIR, signature, reports, allvulnsSections)
+
+    # Search page and index
+    build_search_index(reports, ASSETS_DIR)
+
+    print_run_summary(reports, started)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,32 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyness3 import Finding, Host, merge_hosts
+
+
+def finding(plugin_id, risk_factor="Low", port="80", protocol="tcp"):
+    return Finding(plugin_id, f"Plugin {plugin_id}", risk_factor, port, protocol, "www")
+
+
+def test_merge_keeps_new_findings_when_host_has_duplicate_keys():
+    # host already holds two findings with the same (plugin, port, protocol)
+    host = Host("host.example.com", [finding("1"), finding("1")])
+    other = Host("host.example.com", [finding("2", "High")])
+
+    merged = merge_hosts(host, other)
+
+    assert [v.plugin_id for v in merged._vulns] == ["1", "1", "2"]
+    assert merged._high_count == 1
+
+
+def test_merge_without_new_findings_still_takes_other_mac():
+    host = Host("host.example.com", [finding("1")])
+    other = Host("host.example.com", [finding("1")])
+    other._mac_address = "00:11:22:33:44:55"
+
+    merged = merge_hosts(host, other)
+
+    assert merged._vulns is host._vulns
+    assert merged._mac_address == "00:11:22:33:44:55"